@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+
+
+# Admission control. Every request takes a slot in a lane before it may touch the
+# warehouse; a lane caps how many of its requests run at once and how many may
+# wait behind them, and each waiter has a deadline. A request that finds the
+# queue full, or whose deadline passes while queued, is shed with Overloaded
+# instead of piling onto threads that are already stuck behind the warehouse.
+
+class Overloaded(Exception):
+    def __init__(self, lane, retry_after, reason):
+        super().__init__(f"{lane} lane {reason}; retry in {retry_after}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class Lane:
+    def __init__(self, name, limit, queue_size, max_wait, max_retry_after=30):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.max_retry_after = max_retry_after
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._avg_hold = 0.0  # moving average of how long a slot is held
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def retry_after(self):
+        # Rough time until the current queue has drained through the lane's slots
+        with self._cond:
+            estimate = self._avg_hold * (self._waiting + 1) / max(self.limit, 1)
+        return max(1, min(self.max_retry_after, math.ceil(estimate)))
+
+    def acquire(self):
+        # Returns the time spent queued; raises Overloaded when the request is shed
+        start = time.monotonic()
+        with self._cond:
+            # A free slot is only taken directly when nobody is queued for it
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                self._admitted += 1
+                return 0.0
+            if self._waiting >= self.queue_size:
+                self._rejected += 1
+                shed = "queue is full"
+            else:
+                shed = None
+                deadline = start + self.max_wait
+                self._waiting += 1
+                self._queued += 1
+                try:
+                    while self._active >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timed_out += 1
+                            shed = f"wait exceeded {self.max_wait}s"
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._active += 1
+                        self._admitted += 1
+                finally:
+                    self._waiting -= 1
+                if shed is None:
+                    waited = time.monotonic() - start
+                    self._wait_total += waited
+                    self._wait_max = max(self._wait_max, waited)
+                    return waited
+        raise Overloaded(self.name, self.retry_after(), shed)
+
+    def release(self, held_seconds):
+        with self._cond:
+            self._active -= 1
+            self._avg_hold = held_seconds if not self._avg_hold else 0.8 * self._avg_hold + 0.2 * held_seconds
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            waited = self._queued - self._timed_out
+            return {
+                "limit": self.limit,
+                "queue_size": self.queue_size,
+                "max_wait_seconds": self.max_wait,
+                "active": self._active,
+                "waiting": self._waiting,
+                "admitted": self._admitted,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_hold_ms": round(self._avg_hold * 1000, 1),
+                "avg_wait_ms": round(self._wait_total / waited * 1000, 1) if waited else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 1),
+            }
@@ -0,0 +1,115 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+
+# Optional in-process engine for the dashboard and sourcing aggregates. The
+# warehouse is asked once per refresh for facts at the finest grain these views
+# need (plant x supplier x scored for contracts, plant x producer x CI score for
+# sources); every endpoint aggregate is then a vectorised pandas group-by over
+# those compact frames, scoped by plant the same way the SQL versions are.
+
+CONTRACT_COLUMNS = ["PlantID", "PlantName", "SupplierID", "Scored", "Supplied", "Remaining", "CISum", "CICount"]
+SOURCE_COLUMNS = ["PlantID", "Name", "Type", "CIScore", "Bushels"]
+
+CONTRACT_BUCKETS = ["Grower", "Retailer", "No Score Grower", "No Score Retailer"]
+
+
+def _number(value):
+    return None if pd.isna(value) else float(value)
+
+
+def _memoized(method):
+    # A build never changes once loaded, so each aggregate is computed once per plant scope
+    @functools.wraps(method)
+    def wrapper(self, plantid=None):
+        key = (method.__name__, None if plantid is None else str(plantid))
+        result = self._memo.get(key)
+        if result is None:
+            result = self._memo[key] = method(self, plantid)
+        return result
+    return wrapper
+
+
+def _prepare(frame, columns, categories, measures):
+    frame = frame[columns].copy()
+    # Plant ids are compared as strings so int and str token claims both match
+    frame["plant_key"] = frame["PlantID"].map(lambda v: None if v is None or pd.isna(v) else str(v)).astype("category")
+    for column in categories:
+        frame[column] = frame[column].astype("category")
+    for column in measures:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("float64")
+    return frame
+
+
+class AnalyticsEngine:
+    def __init__(self, contracts, sources):
+        self.contract_facts = _prepare(contracts, CONTRACT_COLUMNS, ["PlantName", "SupplierID"],
+                                       ["Scored", "Supplied", "Remaining", "CISum", "CICount"])
+        self.source_facts = _prepare(sources, SOURCE_COLUMNS, ["Name", "Type"], ["CIScore", "Bushels"])
+        self._memo = {}
+
+    @classmethod
+    def from_tables(cls, contracts, sources):
+        return cls(contracts.to_pandas(), sources.to_pandas())
+
+    def stats(self):
+        return {
+            "contract_facts": len(self.contract_facts),
+            "source_facts": len(self.source_facts),
+            "memory_bytes": int(self.contract_facts.memory_usage(deep=True).sum() + self.source_facts.memory_usage(deep=True).sum()),
+        }
+
+    @staticmethod
+    def _scoped(frame, plantid):
+        return frame if plantid is None else frame[frame["plant_key"] == str(plantid)]
+
+    @_memoized
+    def contract_levels(self, plantid=None):
+        # Rows shaped like CONTRACT_CI_SCORE_LEVELS_SQL: (customertype, delivered, pending, ci_score)
+        frame = self._scoped(self.contract_facts, plantid)
+        supplier, scored = frame["SupplierID"], frame["Scored"] == 1
+        bucket = np.select(
+            [(supplier == "C") & scored, (supplier == "G") & scored, (supplier == "C") & ~scored, (supplier == "G") & ~scored],
+            CONTRACT_BUCKETS, default="Other"
+        )
+        grouped = frame.groupby(bucket, sort=True)
+        delivered = grouped["Supplied"].sum(min_count=1).round(2)
+        pending = grouped["Remaining"].sum(min_count=1).round(2)
+        ci_count = grouped["CICount"].sum()
+        ci = (grouped["CISum"].sum() / ci_count.where(ci_count > 0)).round(2)
+        return [(name, _number(delivered[name]), _number(pending[name]), _number(ci[name])) for name in delivered.index]
+
+    @_memoized
+    def plant_percentages(self, plantid=None):
+        # Rows shaped like PLANTS_CI_SCORE_LEVEL_SQL, ordered by plant name
+        frame = self._scoped(self.contract_facts, plantid)
+        frame = frame[frame["PlantName"].notna()]
+        supplier, scored = frame["SupplierID"], frame["Scored"] == 1
+        supplied = frame["Supplied"].fillna(0.0)
+        parts = {
+            "grower": supplied.where((supplier == "C") & scored, 0.0),
+            "retailer": supplied.where((supplier == "G") & scored, 0.0),
+            "no_score_grower": supplied.where((supplier == "C") & ~scored, 0.0),
+            "no_score_retailer": supplied.where((supplier == "G") & ~scored, 0.0),
+            "other": supplied.where(supplier.notna() & ~supplier.isin(["C", "G"]), 0.0),
+        }
+        by_plant = pd.DataFrame(parts).groupby(frame["PlantName"], observed=True, sort=True).sum()
+        total = frame.groupby("PlantName", observed=True, sort=True)["Supplied"].sum(min_count=1)
+        percentages = (by_plant.mul(100.0).div(total.where(total != 0), axis=0)).round(2)
+        return [(str(name), *(_number(v) for v in row)) for name, row in zip(percentages.index, percentages.to_numpy())]
+
+    @_memoized
+    def sources(self, plantid=None):
+        # Rows shaped like SOURCES_SQL: (name, type, bushels, percent_of_total, ci_score), ordered by name
+        frame = self._scoped(self.source_facts, plantid)
+        bushels = frame.groupby(["Name", "Type", "CIScore"], dropna=False, observed=True, sort=False)["Bushels"].sum(min_count=1)
+        total = bushels.sum(min_count=1)
+        percent = bushels * 100.0 / (total if total else np.nan)
+        result = [
+            (name, producer_type, _number(b), _number(p), _number(ci))
+            for (name, producer_type, ci), b, p in zip(bushels.index, bushels.to_numpy(), percent.to_numpy())
+        ]
+        result.sort(key=lambda row: (str(row[0]), str(row[1])))
+        return result
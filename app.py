@@ -1,88 +1,666 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Blueprint, Response, current_app, g, request, jsonify, make_response, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS, cross_origin
-from databricks import sql
+from werkzeug.wsgi import ClosingIterator
 from dotenv import load_dotenv
+from db import ConnectionPool, DatabricksBackend, PoolTimeout, SingleFlight, TransientWriteError, execute, execute_arrow, fan_out, insert_rows, iter_batches, pa
+from keyvault import SecretProvider
+from cache import ResultCache, RefreshingValue, MISS
+from admission import Lane, Overloaded
+from keepwarm import KeepWarm
+from spatial import ProducerIndex, MAX_ZOOM
+from typeahead import NameIndex, DEFAULT_LIMIT as TYPEAHEAD_DEFAULT_LIMIT, MAX_LIMIT as TYPEAHEAD_MAX_LIMIT
+import metrics
+import paging
+import spreadsheets
+from versions import DataVersions
+from write_queue import WriteQueue
 import os
+import json
 import jwt
+from concurrent.futures import ThreadPoolExecutor
 import datetime
-
-# Azure Key Vault imports
-from azure.identity import ClientSecretCredential
-from azure.keyvault.secrets import SecretClient
+import functools
+import hashlib
+import tempfile
+import time
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
 # FrontendOrigin = "http://172.172.147.218"
 FrontendOrigin = "http://localhost:5173" 
 
-CORS(app, supports_credentials=True, origins=[FrontendOrigin])
+routes = Blueprint("gage", __name__)
+
+# Azure Key Vault secrets - fetched lazily (in parallel) on first use and cached,
+# so importing this module never blocks on the vault. Falls back to .env values.
+secret_provider = SecretProvider(
+    ["DATABRICKS-HOST", "DATABRICKS-HTTP-PATH", "DATABRICKS-TOKEN", "JWT-SECRET"],
+    vault_url=os.getenv("KEY_VAULT_URL"),
+    tenant_id=os.getenv('TENANT_ID'),
+    client_id=os.getenv('CLIENT_ID'),
+    client_secret=os.getenv('CLIENT_SECRET'),
+    ttl=float(os.getenv("SECRET_CACHE_TTL", 3600)),
+)
 
-# Setup Azure Key Vault client
-KEY_VAULT_URL = os.getenv("KEY_VAULT_URL")
+def databricks_credentials():
+    return (
+        secret_provider.get("DATABRICKS-HOST"),
+        secret_provider.get("DATABRICKS-HTTP-PATH"),
+        secret_provider.get("DATABRICKS-TOKEN"),
+    )
 
-credential = ClientSecretCredential(
-        tenant_id =  os.getenv('TENANT_ID'),
-        client_id =  os.getenv('CLIENT_ID'),
-        client_secret =  os.getenv('CLIENT_SECRET')
+# Shared warehouse connection pool (one Thrift session per slot, reused across requests)
+pool = ConnectionPool(
+    DatabricksBackend(databricks_credentials),
+    max_size=int(os.getenv("DB_POOL_SIZE", 8)),
+    acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+    max_idle_seconds=float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+    max_lifetime_seconds=float(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),
+    health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK", 60)),
 )
-secret_client = SecretClient(vault_url=KEY_VAULT_URL, credential=credential)
-
-# Retrieve secrets from Azure Key Vault
-HOST = secret_client.get_secret("DATABRICKS-HOST").value
-HTTP_PATH = secret_client.get_secret("DATABRICKS-HTTP-PATH").value
-ACCESS_TOKEN = secret_client.get_secret("DATABRICKS-TOKEN").value
 
+# Identical reads arriving together (e.g. a whole plant opening the dashboard at
+# shift start) wait on one in-flight execution and share its rows. The data
+# sequence is part of the key, so a read arriving after a write (in any worker)
+# starts its own execution instead of joining one that began before the write.
+inflight = SingleFlight()
+
+def fetch_all(query, params=None):
+    key = (data_versions.sequence(), query, tuple(params) if params else ())
+    return inflight.do(key, lambda: execute(pool, query, params))
+
+def fetch_table(query, params=None):
+    key = (data_versions.sequence(), "arrow", query, tuple(params) if params else ())
+    return inflight.do(key, lambda: execute_arrow(pool, query, params))
+
+# Columnar responses, negotiated through the Accept header. Plain JSON stays the
+# default; clients can ask for column-oriented JSON or an Arrow IPC stream, both
+# built from the Arrow fetch path without materialising row dicts.
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON = "application/vnd.gage.columns+json"
+
+def response_format():
+    return request.accept_mimetypes.best_match(["application/json", COLUMNAR_JSON, ARROW_STREAM], default="application/json")
+
+def wants_columnar():
+    return response_format() != "application/json"
+
+def columnar_response(query, params=None, names=None):
+    table = fetch_table(query, params)
+    if names:
+        table = table.rename_columns(names)
+
+    with metrics.phase("serialize"):
+        if response_format() == ARROW_STREAM:
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM)
+
+        body = current_app.json.dumps({"columns": table.column_names, "data": table.to_pydict()})
+        return Response(body, mimetype=COLUMNAR_JSON)
+
+# Streaming mode (?stream=1): rows are pulled with fetchmany and written out as
+# JSON array chunks, so large listings never sit in memory as a whole.
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 1000))
+
+def wants_stream():
+    return request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+def stream_json(query, params=None, to_item=None):
+    batches = iter_batches(pool, query, params, STREAM_BATCH_SIZE)
+    columns = next(batches)  # runs the statement now so errors still become a 500
+    to_item = to_item or (lambda row: dict(zip(columns, row)))
+    dumps = current_app.json.dumps
+
+    def generate():
+        try:
+            first = True
+            yield "["
+            for batch in batches:
+                with metrics.phase("serialize"):
+                    chunk = ",".join(dumps(item) for item in map(to_item, batch) if item is not None)
+                if chunk:
+                    yield chunk if first else "," + chunk
+                    first = False
+            yield "]"
+        finally:
+            batches.close()  # hands the session back even if the client disconnects
+
+    response = Response(generate(), mimetype="application/json")
+    # generate()'s finally never runs if the body is dropped before it starts (HEAD, early disconnect)
+    response.call_on_close(batches.close)
+    return response
+
+# Bounded executor for running the independent sub-queries of composite endpoints concurrently
+fanout_executor = ThreadPoolExecutor(max_workers=int(os.getenv("FANOUT_WORKERS", 8)), thread_name_prefix="fanout")
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", 30))
+
+# Result cache for read routes. Warehouse data only changes on batch loads and the
+# write endpoints below, so reads are served from memory until their TTL runs out
+# or a write invalidates their tags.
+result_cache = ResultCache(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 512)))
+
+CACHE_TTLS = {
+    "contract-ci-score-levels": float(os.getenv("CACHE_TTL_CONTRACT_CI_SCORE_LEVELS", 300)),
+    "summary-metrics": float(os.getenv("CACHE_TTL_SUMMARY_METRICS", 300)),
+    "plants-ci-score-level": float(os.getenv("CACHE_TTL_PLANTS_CI_SCORE_LEVEL", 300)),
+    "sourcing-sources": float(os.getenv("CACHE_TTL_SOURCING_SOURCES", 600)),
+    "opportunities-map": float(os.getenv("CACHE_TTL_OPPORTUNITIES_MAP", 600)),
+    "data": float(os.getenv("CACHE_TTL_DATA", 120)),
+    "manual-input": float(os.getenv("CACHE_TTL_MANUAL_INPUT", 120)),
+    "business-rules": float(os.getenv("CACHE_TTL_BUSINESS_RULES", 600)),
+    "login": float(os.getenv("CACHE_TTL_LOGIN", 120)),
+    "login-unknown": float(os.getenv("CACHE_TTL_LOGIN_UNKNOWN", 30)),
+}
+
+# Username -> credential/role row for /api/login, kept apart from result_cache so
+# a burst of logins can't evict the cached dashboard responses (or vice versa).
+login_cache = ResultCache(max_entries=int(os.getenv("LOGIN_CACHE_MAX_ENTRIES", 2048)))
+
+# Data version stamps behind the read routes' ETags and cached results (see
+# versions.py). Cached values are stored with the version they were computed at
+# and only served while it is still current, so a write handled by any worker
+# process sharing DATA_VERSIONS_PATH retires every worker's copies and ETags.
+# Replicas on other hosts keep their own file; there a change only shows once the
+# TTL window rolls over, unless the batch job calls /cache/invalidate on each.
+data_versions = DataVersions(os.getenv("DATA_VERSIONS_PATH", "data_versions.db"))
+
+def data_version(tags):
+    return data_versions.current(tags)
+
+def invalidate_cached(*tags):
+    # Drops cached results carrying any of `tags` (everything if none are given).
+    # Bumping the version is what retires them, in this worker and the others;
+    # dropping the local entries only frees their memory early.
+    data_versions.bump(*(tags or ("*",)))
+    return result_cache.invalidate(*tags) + login_cache.invalidate(*tags)
+
+def cached_at(cache, key, version):
+    # The value cached under `key` if it was computed at data `version`, else MISS
+    hit = cache.get(key)
+    if hit is MISS or hit[1] != version:
+        return MISS
+    return hit[0]
+
+def cache_if_current(cache, key, value, ttl, tags, version):
+    # Stores a result computed from data at `version` unless one of its tags has
+    # been invalidated since; returns whether it was stored
+    if data_version(tags) != version:
+        return False
+    cache.set(key, (value, version), ttl, tags)
+    return True
+
+def get_or_compute(cache, key, compute, ttl, tags):
+    # ResultCache.get_or_compute, minus serving or caching a result that a write overtook
+    version = data_version(tags)
+    value = cached_at(cache, key, version)
+    if value is MISS:
+        value = compute()
+        cache_if_current(cache, key, value, ttl, tags, version)
+    return value
+
+def version_etag(name, version):
+    # Weak ETag for a read route's response at data `version`. The TTL window is
+    # part of it so an ETag never outlives what the result cache would serve for
+    # a batch load nobody announced via /cache/invalidate.
+    ttl = CACHE_TTLS[name]
+    window = int(time.time() // ttl) if ttl > 0 else time.time_ns()
+    key = (name, g.plantid, g.erpid, response_format(),
+           tuple(sorted(request.args.items(multi=True))), version, window)
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+# Tenant-specific, so only the browser may keep a copy, and it has to revalidate
+# (a cheap 304 while the data version is unchanged) before reusing it.
+READ_CACHE_CONTROL = os.getenv("READ_CACHE_CONTROL", "private, no-cache")
+
+def with_validators(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = READ_CACHE_CONTROL
+    response.vary.update(("Authorization", "Accept"))
+    return response
+
+def cached(name, tags=()):
+    # Caches successful GET responses keyed by route name, tenant and query string,
+    # and answers If-None-Match with 304 while the route's data version is unchanged
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            # Taken before the view runs; if a write invalidates the tags while the
+            # view runs, its response is neither cached nor given an ETag
+            version = data_version(tags)
+            etag = version_etag(name, version)
+            if request.if_none_match.contains_weak(etag):
+                return with_validators(Response(status=304), etag)
+
+            key = (name, g.plantid, g.erpid, response_format(), tuple(sorted(request.args.items(multi=True))))
+            hit = cached_at(result_cache, key, version)
+            if hit is not MISS:
+                body, mimetype = hit
+                return with_validators(Response(body, status=200, mimetype=mimetype), etag)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                if response.is_streamed:
+                    current = data_version(tags) == version
+                else:
+                    current = cache_if_current(result_cache, key, (response.get_data(), response.mimetype),
+                                               CACHE_TTLS[name], tags, version)
+                if current:
+                    with_validators(response, etag)
+            return response
+        return wrapper
+    return decorator
 
 # JWT Setup
-# SECRET_KEY = os.getenv("JWT_SECRET")
-SECRET_KEY = secret_client.get_secret("JWT-SECRET").value
-# print(SECRET_KEY)
 JWT_EXP_DELTA_SECONDS = 300  # Token valid for 5 minutes
 
-def generate_jwt(email):
+def jwt_secret():
+    return secret_provider.get("JWT-SECRET")
+
+def generate_jwt(email, plantid=None, erpid=None):
+    # plantid/erpid narrow the user's reads to their own plant by default (see resolve_tenant)
     payload = {
         "email": email,
+        "plantid": plantid,
+        "erpid": erpid,
         "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=JWT_EXP_DELTA_SECONDS)
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+    return jwt.encode(payload, jwt_secret(), algorithm="HS256")
+
+# Refresh tokens let the frontend get a new access token from /api/refresh without
+# logging in again (and so without a warehouse lookup) until they expire.
+REFRESH_TOKEN_EXP_SECONDS = int(os.getenv("REFRESH_TOKEN_EXP_SECONDS", 8 * 3600))
+
+def generate_refresh_token(email, plantid=None, erpid=None):
+    payload = {
+        "email": email,
+        "plantid": plantid,
+        "erpid": erpid,
+        "typ": "refresh",
+        "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=REFRESH_TOKEN_EXP_SECONDS)
+    }
+    return jwt.encode(payload, jwt_secret(), algorithm="HS256")
+
+# Verified access-token claims, kept until the token expires so repeat requests
+# with the same token skip the signature check.
+verified_claims = ResultCache(max_entries=int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 4096)))
+
+def verify_access_token(token):
+    # Claims of a valid access token; raises jwt.ExpiredSignatureError / jwt.InvalidTokenError
+    claims = verified_claims.get(token)
+    if claims is MISS:
+        claims = jwt.decode(token, jwt_secret(), algorithms=["HS256"], options={"require": ["exp"]})
+        if claims.get("typ") == "refresh":
+            raise jwt.InvalidTokenError("Refresh tokens cannot be used for access")
+        verified_claims.set(token, claims, claims["exp"] - time.time())
+    return claims
 
 def decode_jwt(token):
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        return verify_access_token(token)
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
-@app.route('/')
+def authenticate():
+    # (claims, None) for a valid bearer token, (None, None) without one, (None, 401 response) for a bad one
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None, None
+    try:
+        return verify_access_token(auth_header.split(" ")[1]), None
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({"message": "Token expired"}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({"message": "Invalid token"}), 401)
+
+def require_auth(view):
+    # Rejects requests without a valid "Authorization: Bearer <token>"; the claims are on g.claims
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        claims, error = authenticate()
+        if error:
+            return error
+        if claims is None:
+            return jsonify({"message": "Unauthorized - No token provided"}), 401
+        g.claims = claims
+        return view(*args, **kwargs)
+    return wrapper
+
+# Plant scope. A token carrying a plantid narrows reads to that plant by default:
+# the plant is pushed into the queries as a predicate and is part of the cache
+# keys, so a plant user's dashboards only scan their own plant's rows. This is a
+# query-cost optimisation, not access control: read routes don't require a token,
+# and an explicit ?plantid= takes precedence. Requests without a token, with an
+# expired or invalid one (the frontend keeps sending its last token), or from
+# all-plant accounts, stay unscoped; only require_auth routes reject a bad token.
+@routes.before_request
+def resolve_tenant():
+    g.claims, g.plantid, g.erpid = None, None, None
+    claims, _ = authenticate()
+    if claims:
+        g.claims = claims
+        g.plantid = claims.get("plantid") or None
+        g.erpid = claims.get("erpid") or None
+
+def scoped_plantid(requested=None):
+    # The plant a read is narrowed to: the one the request asked for, otherwise
+    # the token's plant, if any
+    return requested or g.plantid
+
+def plant_filter(column, plantid, *conditions):
+    # (WHERE clause, params) for an optional plant predicate plus any extra conditions
+    clauses, params = list(conditions), []
+    if plantid is not None:
+        clauses.insert(0, f"{column} = ?")
+        params.append(plantid)
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+@routes.route('/')
 def home():
     return "Flask backend for GAGE is running"
 
-@app.route('/test-connection')
+# Optional (KEEP_WARM=1): keeps the serverless warehouse and KEEP_WARM_SESSIONS pooled
+# sessions warm during the KEEP_WARM_WINDOW business hours (default "mon-fri
+# 06:00-19:00") in KEEP_WARM_TZ, which is required with a window ("always" needs
+# none), pinging every KEEP_WARM_INTERVAL seconds; outside the window it is left to
+# auto-stop. Off by default: a warm warehouse is billed for every hour it is kept up.
+KEEP_WARM_ENABLED = os.getenv("KEEP_WARM", "").lower() in ("1", "true", "yes")
+
+keep_warm = KeepWarm(
+    pool,
+    interval=float(os.getenv("KEEP_WARM_INTERVAL", 240)),
+    window=os.getenv("KEEP_WARM_WINDOW", "mon-fri 06:00-19:00"),
+    timezone=os.getenv("KEEP_WARM_TZ") or None,
+    min_sessions=int(os.getenv("KEEP_WARM_SESSIONS", 2)),
+    failure_threshold=int(os.getenv("KEEP_WARM_FAILURES", 3)),
+)
+
+@routes.route('/test-connection')
 def test_connection():  
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            return jsonify({"status": "Connected to Databricks ✅"})
+        # A recent keep-warm ping already answers the question; otherwise check one pooled session
+        if not keep_warm.fresh():
+            keep_warm.ping()
+        return jsonify({"status": "Connected to Databricks ✅", "warehouse": keep_warm.status()})
     except Exception as e:
-        return jsonify({"status": "Failed", "error": str(e)}), 500
+        return server_error(e, status="Failed")
+
+@routes.route('/ready')
+def readiness():
+    # Readiness from what the process already knows: never opens a session or queries.
+    # Not ready only once KEEP_WARM_FAILURES pings in a row have failed.
+    warehouse = keep_warm.status()
+    if metrics.last_statement is not None:
+        at, seconds = metrics.last_statement
+        warehouse["last_query_at"] = datetime.datetime.fromtimestamp(at, datetime.timezone.utc).isoformat()
+        warehouse["last_query_ms"] = round(seconds * 1000, 1)
+    pool_stats = pool.stats()
+    cache_stats = result_cache.stats()
+    ready = warehouse["state"] != "unreachable"
+    body = {
+        "ready": ready,
+        "warehouse": warehouse,
+        "pool": {k: pool_stats[k] for k in ("max_size", "in_use", "idle", "timeouts", "wait_seconds_avg")},
+        "cache": {k: cache_stats[k] for k in ("entries", "hit_ratio", "evictions")},
+        "admission": {name: lane.stats() for name, lane in ADMISSION_LANES.items()},
+        "write_queue": write_queue.stats(),
+    }
+    return jsonify(body), 200 if ready else 503
+
+# -------------------- INSTRUMENTATION --------------------
+
+# Statements taking at least this long (execute + fetch) are logged with their fingerprint
+metrics.slow_query_seconds = float(os.getenv("SLOW_QUERY_SECONDS", 2))
+
+class TimedJSONProvider(DefaultJSONProvider):
+    # jsonify() goes through response(); time it as the request's serialize phase
+    def response(self, *args, **kwargs):
+        with metrics.phase("serialize"):
+            return super().response(*args, **kwargs)
+
+@routes.before_app_request
+def start_request_trace():
+    metrics.start_trace(request.url_rule.rule if request.url_rule else "unmatched")
+
+@routes.after_app_request
+def finish_request_trace(response):
+    trace = metrics.current_trace()
+    if trace is not None:
+        metrics.REQUEST_SECONDS.observe(trace.elapsed(), trace.route, request.method, str(response.status_code))
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Timing-Allow-Origin"] = FrontendOrigin
+    return response
+
+# -------------------- ADMISSION CONTROL --------------------
+
+# Requests queue for a slot in their lane before running (see admission.py).
+# Logins/refreshes and writes get lanes of their own so a burst of heavy reads
+# can't starve them, and the heaviest read routes are capped individually.
+# Shed requests get 503 + Retry-After. Limits are per worker process.
+def lane_from_env(name, limit, queue_size, max_wait):
+    prefix = "ADMISSION_" + name.upper().replace("-", "_")
+    return Lane(
+        name,
+        limit=int(os.getenv(f"{prefix}_LIMIT", limit)),
+        queue_size=int(os.getenv(f"{prefix}_QUEUE", queue_size)),
+        max_wait=float(os.getenv(f"{prefix}_WAIT", max_wait)),
+    )
 
-@app.route('/data')
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL", "1").lower() not in ("0", "false", "no")
+
+ADMISSION_LANES = {lane.name: lane for lane in (
+    lane_from_env("auth", 16, 64, 5),
+    lane_from_env("write", 4, 32, 10),
+    lane_from_env("read", 16, 64, 10),
+    lane_from_env("sources", 4, 16, 10),
+    lane_from_env("map", 4, 16, 10),
+    lane_from_env("export", 2, 8, 15),
+)}
+
+ROUTE_LANES = {
+    "gage.login": "auth",
+    "gage.refresh": "auth",
+    "gage.protected": "auth",
+    "gage.send_password_reset_email": "auth",
+    "gage.producer_bushels_with_ci": "sources",
+    "gage.producer_location_ci": "map",
+    "gage.producer_location_tiles": "map",
+    "gage.nearby_low_ci_producers": "map",
+    "gage.export_dataset": "export",
+}
+
+# Served from process memory or the local journal; never queued, so operators can
+# still see what is going on while the warehouse lanes are saturated
+ADMISSION_EXEMPT = {
+    "gage.home", "gage.readiness", "gage.prometheus_metrics", "gage.pool_stats", "gage.cache_stats",
+    "gage.admission_stats", "gage.write_queue_stats", "gage.write_job_status",
+}
+
+def admission_lane():
+    if request.method == "OPTIONS" or request.endpoint is None or request.endpoint in ADMISSION_EXEMPT:
+        return None
+    lane = ROUTE_LANES.get(request.endpoint)
+    if lane is None:
+        lane = "read" if request.method in ("GET", "HEAD") else "write"
+    return ADMISSION_LANES[lane]
+
+def overloaded_response(message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+def server_error(e, **fields):
+    # 500 for the exception, except warehouse saturation or unavailability, which is a 503 the client may retry
+    if isinstance(e, (PoolTimeout, Overloaded, TransientWriteError)):
+        lane = g.get("admission")
+        retry_after = e.retry_after if isinstance(e, Overloaded) else (lane[0].retry_after() if lane else 1)
+        return overloaded_response(str(e), retry_after)
+    return jsonify({**fields, "error": str(e)}), 500
+
+@routes.before_app_request
+def admit_request():
+    lane = admission_lane() if ADMISSION_ENABLED else None
+    if lane is None:
+        return None
+    try:
+        waited = lane.acquire()
+    except Overloaded as e:
+        return overloaded_response(str(e), e.retry_after)
+    if waited:
+        metrics.record_phase("queue", waited)
+    g.admission = (lane, time.monotonic())
+
+def release_admission(lane, since):
+    lane.release(time.monotonic() - since)
+
+@routes.after_app_request
+def hold_admission_until_sent(response):
+    # A streamed body keeps reading from the warehouse after the view returns,
+    # so the slot is handed back once the response is closed
+    admitted = g.pop("admission", None)
+    if admitted is None:
+        return response
+    release = functools.partial(release_admission, *admitted)
+    if response.direct_passthrough:
+        # send_file hands its file wrapper straight to the server, which never
+        # calls Response.close(); the wrapper's own close() has to release instead
+        response.response = ClosingIterator(response.response, release)
+    else:
+        response.call_on_close(release)
+    return response
+
+@routes.teardown_app_request
+def release_unsent_admission(exc):
+    admitted = g.pop("admission", None)
+    if admitted is not None:
+        release_admission(*admitted)
+
+@routes.route('/admission-stats')
+def admission_stats():
+    return jsonify({name: lane.stats() for name, lane in ADMISSION_LANES.items()})
+
+def admission_gauges():
+    gauges = {}
+    for name, lane in ADMISSION_LANES.items():
+        stats, key = lane.stats(), name.replace("-", "_")
+        gauges[f"gage_admission_{key}_active"] = (f"Requests running in the {name} lane", stats["active"])
+        gauges[f"gage_admission_{key}_waiting"] = (f"Requests queued for the {name} lane", stats["waiting"])
+        gauges[f"gage_admission_{key}_shed"] = (f"Requests shed by the {name} lane", stats["rejected"] + stats["timed_out"])
+    return gauges
+
+@routes.route('/metrics')
+def prometheus_metrics():
+    pool_stats = pool.stats()
+    cache_stats = result_cache.stats()
+    body = metrics.render({
+        "gage_pool_in_use": ("Pooled sessions checked out", pool_stats["in_use"]),
+        "gage_pool_idle": ("Pooled sessions idle", pool_stats["idle"]),
+        "gage_pool_acquire_timeouts": ("Pool acquires that timed out", pool_stats["timeouts"]),
+        "gage_cache_entries": ("Result cache entries", cache_stats["entries"]),
+        "gage_cache_hits": ("Result cache hits", cache_stats["hits"]),
+        "gage_cache_misses": ("Result cache misses", cache_stats["misses"]),
+        **admission_gauges(),
+    })
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+@routes.route('/pool-stats')
+def pool_stats():
+    return jsonify(pool.stats())
+
+@routes.route('/cache-stats')
+def cache_stats():
+    stats = result_cache.stats()
+    stats["login"] = login_cache.stats()
+    stats["auth"] = verified_claims.stats()
+    if ANALYTICS_ENABLED:
+        stats["analytics"] = analytics.stats()
+    return jsonify(stats)
+
+# Called by the batch load job once new data has landed
+@routes.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    data = request.get_json(silent=True) or {}
+    tags = data.get("tags", [])
+    removed = invalidate_cached(*tags)
+    return jsonify({"status": "Cache invalidated", "removed": removed})
+
+# Keyset order for paging through the customer table (?limit=&after=)
+CUSTOMER_PAGE_KEYS = [
+    "COALESCE(CAST(customerid AS STRING), '')",
+    "COALESCE(CAST(userid AS STRING), '')",
+    "COALESCE(email, '')",
+]
+
+@routes.route('/data')
+@cached("data", tags=("customer",))
 def get_data():
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT * FROM gage_dev_databricks.gold_layer.customer LIMIT 10")
-                rows = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                result = [dict(zip(columns, row)) for row in rows]
-                return jsonify(result)
+        if "limit" in request.args or "after" in request.args:
+            return get_data_page()
+
+        where, params = plant_filter("plantid", g.plantid)
+        columns, rows = fetch_all(f"SELECT * FROM gage_dev_databricks.gold_layer.customer {where} LIMIT 10", params)
+        result = [dict(zip(columns, row)) for row in rows]
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
+
+def get_data_page():
+    limit = paging.parse_limit(request.args.get("limit"), default=10)
+    keys = CUSTOMER_PAGE_KEYS
+    conditions, cursor_params = [], []
+    if request.args.get("after"):
+        predicate, cursor_params = paging.keyset_predicate(keys, paging.decode_cursor(request.args["after"], len(keys)))
+        conditions.append(predicate)
+    where, params = plant_filter("plantid", g.plantid, *conditions)
+    params += cursor_params
+
+    key_columns = ", ".join(f"{k} AS _k{i}" for i, k in enumerate(keys))
+    columns, rows = fetch_all(f"""
+        SELECT *, {key_columns}
+        FROM gage_dev_databricks.gold_layer.customer
+        {where}
+        ORDER BY {paging.order_by(keys)}
+        LIMIT {limit + 1}
+    """, params)
+
+    page, has_more = rows[:limit], len(rows) > limit
+    columns = columns[:-len(keys)]
+    return jsonify({
+        "items": [dict(zip(columns, row[:len(columns)])) for row in page],
+        "next": paging.encode_cursor(page[-1][len(columns):]) if has_more else None
+    })
 
 # ✅ Login Route with JWT returned in response
-@app.route('/api/login', methods=['POST', 'OPTIONS'])
+LOGIN_SQL = """
+    select r.roleid,r.role,u.password,u.erpid,u.plantid
+    from gold.userinfo as u inner join gold.rolemasterinfo as r on u.roleid=r.roleid  WHERE u.username = ?
+"""
+
+def lookup_login(email):
+    # (roleid, role, password, erpid, plantid) for a username, or None if there is no
+    # such user. Unknown usernames are cached too (briefly) so retries don't hit the warehouse.
+    key = ("login", email)
+    version = data_version(("customer",))
+    result = cached_at(login_cache, key, version)
+    if result is MISS:
+        _, rows = fetch_all(LOGIN_SQL, (email,))
+        result = tuple(rows[0]) if rows else None
+        cache_if_current(login_cache, key, result, CACHE_TTLS["login" if result else "login-unknown"], ("customer",), version)
+    return result
+
+@routes.route('/api/login', methods=['POST', 'OPTIONS'])
 def login():
     if request.method == 'OPTIONS':
         response = make_response()
@@ -100,57 +678,58 @@ def login():
         return jsonify({"message": "Email and password are required"}), 400
 
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                select r.roleid,r.role,u.password,u.erpid,u.plantid
-from gold.userinfo as u inner join gold.rolemasterinfo as r on u.roleid=r.roleid  WHERE u.username = ?
-                """, (email,))
-                
-                result = cursor.fetchone()
-                if not result or password != result[2]:
-                    return jsonify({"message": "Invalid email or password"}), 401
-
-                userrole = result[1]
-                erpid = result[3]
-                plantid = result[4]
-                token = generate_jwt(email)
-               
-                response = jsonify({
-                    "message": "Login successful",
-                    "userrole": userrole,
-                    "plantid": plantid,
-                    "erpid": erpid,
-                    "token": token  # Send token to frontend
-                })
-                response.headers["Access-Control-Allow-Origin"] = FrontendOrigin
-                response.headers["Access-Control-Allow-Credentials"] = "true"
-                return response
+        result = lookup_login(email)
+        if not result or password != result[2]:
+            return jsonify({"message": "Invalid email or password"}), 401
+
+        userrole = result[1]
+        erpid = result[3]
+        plantid = result[4]
+        token = generate_jwt(email, plantid, erpid)
+       
+        response = jsonify({
+            "message": "Login successful",
+            "userrole": userrole,
+            "plantid": plantid,
+            "erpid": erpid,
+            "token": token,  # Send token to frontend
+            "refresh_token": generate_refresh_token(email, plantid, erpid)
+        })
+        response.headers["Access-Control-Allow-Origin"] = FrontendOrigin
+        response.headers["Access-Control-Allow-Credentials"] = "true"
+        return response
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
 
 # ✅ Protected route using Authorization header
-@app.route('/api/protected', methods=['GET'])
+@routes.route('/api/protected', methods=['GET'])
 @cross_origin(origin=FrontendOrigin, supports_credentials=True)
+@require_auth
 def protected():
-    auth_header = request.headers.get('Authorization')
+    return jsonify({"message": "Protected route access granted"})
 
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"message": "Unauthorized - No token provided"}), 401
-
-    token = auth_header.split(" ")[1]
-    # print(f"Received token:", token)
+# Swap a refresh token (from /api/login) for a new access token
+@routes.route('/api/refresh', methods=['POST'])
+@cross_origin(origin=FrontendOrigin, supports_credentials=True)
+def refresh():
+    data = request.get_json(silent=True) or {}
+    refresh_token = data.get("refresh_token")
+    if not refresh_token:
+        return jsonify({"message": "refresh_token is required"}), 400
 
     try:
-        decoded_token = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return jsonify({"message": "Protected route access granted"})
+        claims = jwt.decode(refresh_token, jwt_secret(), algorithms=["HS256"], options={"require": ["exp"]})
     except jwt.ExpiredSignatureError:
-        return jsonify({"message": "Token expired"}), 401
+        return jsonify({"message": "Refresh token expired"}), 401
     except jwt.InvalidTokenError:
-        return jsonify({"message": "Invalid token"}), 401
+        return jsonify({"message": "Invalid refresh token"}), 401
+    if claims.get("typ") != "refresh":
+        return jsonify({"message": "Invalid refresh token"}), 401
+
+    return jsonify({"token": generate_jwt(claims["email"], claims.get("plantid"), claims.get("erpid"))})
 
 # ✅ Logout route (optional)
-# @app.route("/api/logout", methods=["POST"])
+# @routes.route("/api/logout", methods=["POST"])
 # def logout():
 #     response = make_response(jsonify({"message": "Logged out"}))
 #     response.set_cookie(
@@ -163,27 +742,75 @@ def protected():
 #     )
 #     return response
 
-@app.route('/insert-user', methods=['POST'])
+# Columns of gold_layer.customer written by the user endpoints, in insert order
+CUSTOMER_FIELDS = [
+    "customerid", "customername", "source", "customertype", "erp", "plantname",
+    "plantid", "locationname", "locationid", "firstname", "lastname", "userid",
+    "email", "userrole", "createddate", "modifydate", "password"
+]
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", 50))
+
+def read_bulk_records():
+    # JSON array body, or NDJSON (one object per line) read line by line from the stream.
+    # Yields (row_number, record or None, parse error or None).
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        for row_number, line in enumerate(request.stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield row_number, json.loads(line), None
+            except ValueError as e:
+                yield row_number, None, f"Invalid JSON: {e}"
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            raise ValueError("Body must be a JSON array or NDJSON (application/x-ndjson)")
+        for row_number, record in enumerate(data, start=1):
+            yield row_number, record, None
+
+def bulk_insert(table, fields, records):
+    # Validates every record, writes the valid ones in batches and reports per-row errors
+    errors, rows, received = [], [], 0
+    for row_number, record, error in records:
+        received += 1
+        if error is None and not isinstance(record, dict):
+            error = "Record must be a JSON object"
+        elif error is None:
+            missing = [field for field in fields if field not in record]
+            if missing:
+                error = f"Missing field: {', '.join(missing)}"
+        if error:
+            errors.append({"row": row_number, "error": error})
+        else:
+            rows.append((row_number, tuple(record[f] for f in fields)))
+
+    failed = insert_rows(pool, table, fields, rows, BULK_INSERT_BATCH_SIZE) if rows else {}
+    errors.extend({"row": n, "error": e} for n, e in failed.items())
+    errors.sort(key=lambda e: e["row"])
+    return {
+        "received": received,
+        "inserted": len(rows) - len(failed),
+        "failed": len(errors),
+        "errors": errors
+    }
+
+@routes.route('/insert-user', methods=['POST'])
 def insert_user():
     try:
         data = request.json
 
         # Validate required fields (optional, for safety)
-        required_fields = [
-            "customerid", "customername", "source", "customertype", "erp", "plantname",
-            "plantid", "locationname", "locationid", "firstname", "lastname", "userid",
-            "email", "userrole", "createddate", "modifydate", "password"
-        ]
+        required_fields = CUSTOMER_FIELDS
         for field in required_fields:
             if field not in data:
                 return jsonify({"error": f"Missing field: {field}"}), 400
 
+        if wants_async():
+            return queued_response(write_queue.enqueue("customer", [tuple(data[f] for f in CUSTOMER_FIELDS)]))
+
         # Connect and insert
-        with sql.connect(
-            server_hostname=HOST,
-            http_path=HTTP_PATH,
-            access_token=ACCESS_TOKEN
-        ) as connection:
+        with pool.connection() as connection:
             with connection.cursor() as cursor:
                 cursor.execute(f"""
                     INSERT INTO gage_dev_databricks.gold_layer.customer (
@@ -200,11 +827,31 @@ def insert_user():
                     data['createddate'], data['modifydate'], data['password']
                 ))
 
+        invalidate_cached("customer")
         return jsonify({"status": "User inserted successfully ✅"})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
 
-@app.route('/delete-user', methods=['DELETE'])
+# Bulk variant of /insert-user: a JSON array or NDJSON stream of user records, written
+# in batched multi-row INSERTs on one session. Invalid or rejected rows are reported
+# individually without aborting the rest.
+@routes.route('/insert-users', methods=['POST'])
+def insert_users():
+    try:
+        result = bulk_insert("gage_dev_databricks.gold_layer.customer", CUSTOMER_FIELDS, read_bulk_records())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        if getattr(e, "written", None):  # a TransientWriteError after some batches landed
+            invalidate_cached("customer")
+        return server_error(e)
+
+    if result["inserted"]:
+        invalidate_cached("customer")
+    result["status"] = "Users inserted ✅" if not result["failed"] else "Users inserted with errors"
+    return jsonify(result), 200 if result["inserted"] or not result["received"] else 400
+
+@routes.route('/delete-user', methods=['DELETE'])
 def delete_user():
     data = request.get_json()
     print("Delete request data:", data)
@@ -215,24 +862,21 @@ def delete_user():
     userrole = data['userrole']
 
     try:
-        with sql.connect(
-            server_hostname=HOST,
-            http_path=HTTP_PATH,
-            access_token=ACCESS_TOKEN
-        ) as connection:
+        with pool.connection() as connection:
             with connection.cursor() as cursor:
                 cursor.execute("""
                     DELETE FROM gage_dev_databricks.gold_layer.customer
                     WHERE userrole = ?
                 """, (userrole,))
         
+        invalidate_cached("customer")
         return jsonify({"status": f"User with userid '{userrole}' deleted successfully ✅"})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
 
 # -------------------- PASSWORD RESET ENDPOINT --------------------
 
-@app.route("/api/reset-password-request", methods=["POST"])
+@routes.route("/api/reset-password-request", methods=["POST"])
 def send_password_reset_email():
     data = request.get_json()
     customer_id = data.get("customerId")
@@ -267,7 +911,7 @@ def generate_reset_token(customer_id):
         "customer_id": customer_id,
         "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
     }
-    token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+    token = jwt.encode(payload, jwt_secret(), algorithm="HS256")
     return token
 
 # Dummy functions for demonstration
@@ -283,103 +927,151 @@ def send_email(to, subject, html):
     # Implement using SendGrid, SMTP, etc.
     print(f"Sending email to {to} with subject {subject}")
     
-@app.route('/api/dashboard-metrics', methods=['GET'])
+# -------------------- ANALYTICS ENGINE --------------------
+
+# Optional (ANALYTICS_ENGINE=1): contract and sourcing facts are pulled from the
+# warehouse pre-grouped to the grain the dashboards need, held in memory and
+# rebuilt in the background every ANALYTICS_TTL seconds. After a "dashboard" or
+# "sourcing" invalidation the next read rebuilds it first, so aggregates cached
+# under the new data version never come from the old build.
+# The contract levels, per-plant percentages and source shares are then computed
+# in process instead of as separate warehouse scans.
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENGINE", "").lower() in ("1", "true", "yes")
+
+ANALYTICS_CONTRACTS_SQL = """
+    SELECT
+        c.PlantID,
+        pm.PlantName,
+        c.SupplierID,
+        CASE WHEN ci.ci_score_final_gc02e_per_bu IS NULL THEN 0 ELSE 1 END AS Scored,
+        SUM(CAST(c.SuppliedQuantity AS DOUBLE)) AS Supplied,
+        SUM(CAST(c.RemainingQuantity AS DOUBLE)) AS Remaining,
+        SUM(ci.ci_score_final_gc02e_per_MJ) AS CISum,
+        COUNT(ci.ci_score_final_gc02e_per_MJ) AS CICount
+    FROM gold.contractdata c
+    LEFT OUTER JOIN gold.plant_master pm ON pm.PlantId = c.PlantID
+    LEFT OUTER JOIN bronze.cultura_ci ci ON ci.producer_id = c.NameID
+    GROUP BY 1, 2, 3, 4
+"""
+
+ANALYTICS_SOURCES_SQL = """
+    SELECT
+        c.PlantID,
+        p.Name,
+        p.Type,
+        ci.ci_score_final_gc02e_per_MJ AS CIScore,
+        SUM(cq.QtyOfBushels) AS Bushels
+    FROM
+        gold.producer p
+    INNER JOIN
+        gold.contract c ON p.NameID = c.NameID
+    INNER JOIN
+        gold.contractqty cq ON cq.ContractID = c.ContractID
+    INNER JOIN
+        bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
+    GROUP BY 1, 2, 3, 4
+"""
+
+def load_analytics():
+    # Imported here so pandas is only loaded once the engine is enabled, not at
+    # every worker start. Sequential on purpose: the first load can run inside a
+    # fan_out task, which must not wait on the same executor
+    from analytics import AnalyticsEngine
+    return AnalyticsEngine.from_tables(fetch_table(ANALYTICS_CONTRACTS_SQL), fetch_table(ANALYTICS_SOURCES_SQL))
+
+analytics = RefreshingValue(load_analytics, ttl=float(os.getenv("ANALYTICS_TTL", 600)), name="analytics",
+                            version=lambda: data_version(("dashboard", "sourcing")))
+
+# -------------------- CONTRACT CI SCORE LEVELS --------------------
+
+# Delivered (SuppliedQuantity) and pending (RemainingQuantity) bushels per customer
+# type come from the same contract/CI join, so both are summed in a single scan.
+CONTRACT_CI_SCORE_LEVELS_SQL = """
+    SELECT
+        CASE
+            WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Grower'
+            WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Retailer'
+            WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Grower'
+            WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Retailer'
+            ELSE 'Other'
+        END AS customertype,
+        ROUND(SUM(c.SuppliedQuantity),2) AS DeliveredBushels,
+        ROUND(SUM(c.RemainingQuantity),2) AS PendingBushels,
+        ROUND(AVG(ci.ci_score_final_gc02e_per_MJ),2) CIScore
+    FROM gold.contractdata c
+    LEFT OUTER JOIN bronze.cultura_ci ci ON ci.producer_id = c.NameID
+    {scope}
+    GROUP BY 1
+"""
+
+# The dashboard page calls both endpoints on load; the cached result lets the
+# second call reuse the first one's scan.
+def contract_ci_score_levels(plantid=None):
+    return get_or_compute(
+        result_cache, ("contract-ci-score-levels", plantid), lambda: _load_contract_ci_score_levels(plantid),
+        CACHE_TTLS["contract-ci-score-levels"], tags=("dashboard",)
+    )
+
+def _load_contract_ci_score_levels(plantid):
+    if ANALYTICS_ENABLED:
+        rows = analytics.get().contract_levels(plantid)
+    else:
+        scope, params = plant_filter("c.PlantID", plantid)
+        _, rows = fetch_all(CONTRACT_CI_SCORE_LEVELS_SQL.format(scope=scope), params)
+
+    delivered = [{"nameidtype": row[0], "total_delivered": row[1], "ci_score": row[3]} for row in rows if len(row) >= 4]
+    pending = [{"nameidtype": row[0], "total_pending": row[2], "ci_score": row[3]} for row in rows if len(row) >= 4]
+    return delivered, pending
+
+# summary card data 
+def load_dashboard_summary():
+    _, summary_data = fetch_all("""
+        SELECT 
+            contractedciscore,
+            contractedbushels,
+            rebate,
+            authorizedgrowers
+        FROM gold_layer.metadata;
+    """)
+    # print(f"Summary Data:", summary_data)
+    return [{
+        "contracted_ci_score": row[0],
+        "contracted_bushels": row[1],
+        "rebate": row[2],
+        "authorized_growers": row[3]
+    } for row in summary_data]
+
+@routes.route('/api/dashboard-metrics', methods=['GET'])
 def dashboard():
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                # Contracted CI Score
-                # cursor.execute("SELECT ROUND(AVG(ci_score_final_gc02e_per_MJ), 2)FROM gold_layer.dashboard_info;")
-                # ci_score = cursor.fetchone()[0]
+        # Contracted CI Score
+        # cursor.execute("SELECT ROUND(AVG(ci_score_final_gc02e_per_MJ), 2)FROM gold_layer.dashboard_info;")
+        # ci_score = cursor.fetchone()[0]
 
-                # Total Bushels
-                # cursor.execute("SELECT ROUND(SUM(contract_contractquantity), 2)FROM gold_layer.dashboard_info;")
-                # total_bushels = cursor.fetchone()[0]
+        # Total Bushels
+        # cursor.execute("SELECT ROUND(SUM(contract_contractquantity), 2)FROM gold_layer.dashboard_info;")
+        # total_bushels = cursor.fetchone()[0]
 
-                # Authorized Grower Percentage
+        # Authorized Grower Percentage
 #                 cursor.execute("""
 #                     SELECT ROUND(AVG(CASE WHEN contract_schedules_schedule_nameidtype = 'C' THEN 100.0 ELSE 0.0 END), 2)
 # FROM gold_layer.dashboard_info;
 #                 """)
 #                 authorized_grower = cursor.fetchone()[0]
 
-                # Contract BI CI Score Level Delivered
+        # Summary cards and the contract CI levels don't depend on each other, so run
+        # them side by side; the endpoint then takes as long as the slower of the two.
+        results, errors = fan_out(fanout_executor, {
+            "summary": load_dashboard_summary,
+            "contract_levels": functools.partial(contract_ci_score_levels, g.plantid),
+        }, FANOUT_TIMEOUT)
+        if not results:
+            return jsonify({"error": "All dashboard queries failed", "errors": errors}), 500
 
-                cursor.execute("""
-                    SELECT
-    CASE
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Retailer'
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Retailer'
-        ELSE 'Other' -- Changed 'Custome' to 'Other' for clarity and common practice
-    END AS customertype,
-    ROUND(SUM(c.SuppliedQuantity),2) AS Bushels,
-    ROUND(AVG(ci.ci_score_final_gc02e_per_MJ),2) CIScore
-from gold.contractdata c
-    left outer join bronze.cultura_ci ci on ci.producer_id=c.NameID
-GROUP BY
-    CASE
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Retailer'
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Retailer'
-        ELSE 'Other'
-END;
-                """)
-                contract_delivered_data = cursor.fetchall()
-                
-                contract_delivered = [{"nameidtype": row[0], "total_delivered": row[1], "ci_score": row[2]} for row in contract_delivered_data if len(row) >= 3]
-
-
-                # Contract BI CI Score Level Pending 
+        summary = results.get("summary", [])
+        contract_delivered, contract_pending = results.get("contract_levels", ([], []))
 
-                cursor.execute("""
-                  SELECT
-    CASE
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Retailer'
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Retailer'
-        ELSE 'Other' -- Changed 'Custome' to 'Other' for clarity and common practice
-    END AS customertype,
-    ROUND(SUM(c.RemainingQuantity),2) AS Bushels,
-    ROUND(AVG(ci.ci_score_final_gc02e_per_MJ),2) CIScore
-from gold.contractdata c
-    left outer join bronze.cultura_ci ci on ci.producer_id=c.NameID
-GROUP BY
-    CASE
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Retailer'
-        WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Grower'
-        WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Retailer'
-        ELSE 'Other'
-END;
-                """)
-                contract_pending_data = cursor.fetchall()
-                contract_pending = [{"nameidtype": row[0], "total_pending": row[1], "ci_score": row[2]} for row in contract_pending_data if len(row) >= 3]
-
-
-            # summary card data 
-                cursor.execute("""
-                    SELECT 
-                contractedciscore,
-                contractedbushels,
-                rebate,
-                authorizedgrowers
-                FROM gold_layer.metadata;
-                """)           
-                summary_data = cursor.fetchall()
-                summary = [{
-                    "contracted_ci_score": row[0],
-                    "contracted_bushels": row[1],
-                    "rebate": row[2],
-                    "authorized_growers": row[3]
-                } for row in summary_data]
-                
-                # print(f"Summary Data:", summary_data)
-
-        return jsonify({
+        payload = {
             # "contracted_ci_score": ci_score,
             # "total_bushels": total_bushels,
             # "authorized_grower_percentage": authorized_grower,
@@ -388,251 +1080,470 @@ END;
             # "bushels_ci_score_level_delivered": bushels_delivered,
             # "bushels_ci_score_level_pending": bushels_pending,
             "summary": summary
-        })
+        }
+        if errors:
+            # Partial result: report which parts are missing instead of failing the whole page
+            payload["errors"] = errors
+        return jsonify(payload)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
 
-@app.route('/dashboard/summary-metrics', methods=['GET'])
+@routes.route('/dashboard/summary-metrics', methods=['GET'])
+@cached("summary-metrics", tags=("dashboard",))
 def summary_metrics():
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT 
-                        contractedciscore,
-                        contractedbushels,
-                        rebate,
-                        authorizedgrowers
-                    FROM gold.dashboardinfo;
-                """)
-                rows = cursor.fetchall()
-                summary = [{
-                    "contracted_ci_score": row[0],
-                    "contracted_bushels": row[1],
-                    "rebate": row[2],
-                    "authorized_growers": row[3]
-                } for row in rows]
+        _, rows = fetch_all("""
+            SELECT 
+                contractedciscore,
+                contractedbushels,
+                rebate,
+                authorizedgrowers
+            FROM gold.dashboardinfo;
+        """)
+        summary = [{
+            "contracted_ci_score": row[0],
+            "contracted_bushels": row[1],
+            "rebate": row[2],
+            "authorized_growers": row[3]
+        } for row in rows]
         return jsonify(summary)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500    
+        return server_error(e)    
     
-@app.route('/dashboard/contract-ci-score-level', methods=['GET'])
+@routes.route('/dashboard/contract-ci-score-level', methods=['GET'])
+@cached("contract-ci-score-levels", tags=("dashboard",))
 def contract_ci_score_level():
     
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                # Delivered
-                cursor.execute("""
-                    SELECT
-                        CASE
-                            WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Grower'
-                            WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Retailer'
-                            WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Grower'
-                            WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Retailer'
-                            ELSE 'Other'
-                        END AS customertype,
-                        ROUND(SUM(c.SuppliedQuantity),2) AS Bushels,
-                        ROUND(AVG(ci.ci_score_final_gc02e_per_MJ),2) CIScore
-                    FROM gold.contractdata c
-                    LEFT OUTER JOIN bronze.cultura_ci ci ON ci.producer_id = c.NameID
-                    GROUP BY 1
-                """)
-                delivered_data = cursor.fetchall()
-                delivered = [{"nameidtype": row[0], "total_delivered": row[1], "ci_score": row[2]} for row in delivered_data]
-
-                # Pending
-                cursor.execute("""
-                    SELECT
-                        CASE
-                            WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Grower'
-                            WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NOT NULL THEN 'Retailer'
-                            WHEN c.SupplierID = 'C' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Grower'
-                            WHEN c.SupplierID = 'G' AND ci_score_final_gc02e_per_bu IS NULL THEN 'No Score Retailer'
-                            ELSE 'Other'
-                        END AS customertype,
-                        ROUND(SUM(c.RemainingQuantity),2) AS Bushels,
-                        ROUND(AVG(ci.ci_score_final_gc02e_per_MJ),2) CIScore
-                    FROM gold.contractdata c
-                    LEFT OUTER JOIN bronze.cultura_ci ci ON ci.producer_id = c.NameID
-                    GROUP BY 1
-                """)
-                pending_data = cursor.fetchall()
-                pending = [{"nameidtype": row[0], "total_pending": row[1], "ci_score": row[2]} for row in pending_data]
-
+        delivered, pending = contract_ci_score_levels(g.plantid)
         return jsonify({
             "contract_ci_score_level_delivered": delivered,
             "contract_ci_score_level_pending": pending
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
     
 
-@app.route('/dashboard/plants-ci-score-level', methods=['GET'])
+PLANTS_CI_SCORE_LEVEL_SQL = """
+    WITH CustomerTypeBushels AS (
+        SELECT
+            pm.PlantName,
+            SUM(CASE WHEN c.SupplierID = 'C' AND ci.ci_score_final_gc02e_per_bu IS NOT NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS Grower_Bushels,
+            SUM(CASE WHEN c.SupplierID = 'G' AND ci.ci_score_final_gc02e_per_bu IS NOT NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS Retailer_Bushels,
+            SUM(CASE WHEN c.SupplierID = 'C' AND ci.ci_score_final_gc02e_per_bu IS NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS NoScoreGrower_Bushels,
+            SUM(CASE WHEN c.SupplierID = 'G' AND ci.ci_score_final_gc02e_per_bu IS NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS NoScoreRetailer_Bushels,
+            SUM(CASE WHEN c.SupplierID NOT IN ('C', 'G') THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS Other_Bushels,
+            SUM(CAST(c.SuppliedQuantity AS DOUBLE)) AS TotalBushels_Plant
+        FROM
+            gold.contractdata c
+        INNER JOIN
+            gold.plant_master pm ON pm.PlantId = c.PlantID
+        LEFT OUTER JOIN
+            bronze.cultura_ci ci ON ci.producer_id = c.NameID
+        {scope}
+        GROUP BY
+            pm.PlantName
+    )
+    SELECT
+        PlantName,
+        ROUND((Grower_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS Grower_Percentage,
+        ROUND((Retailer_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS Retailer_Percentage,
+        ROUND((NoScoreGrower_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS NoScoreGrower_Percentage,
+        ROUND((NoScoreRetailer_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS NoScoreRetailer_Percentage,
+        ROUND((Other_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS Other_Percentage
+    FROM
+        CustomerTypeBushels
+    ORDER BY
+        PlantName;
+"""
+
+@routes.route('/dashboard/plants-ci-score-level', methods=['GET'])
+@cached("plants-ci-score-level", tags=("dashboard",))
 def customer_type_percentage_by_plant():
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    WITH CustomerTypeBushels AS (
-                        SELECT
-                            pm.PlantName,
-                            SUM(CASE WHEN c.SupplierID = 'C' AND ci.ci_score_final_gc02e_per_bu IS NOT NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS Grower_Bushels,
-                            SUM(CASE WHEN c.SupplierID = 'G' AND ci.ci_score_final_gc02e_per_bu IS NOT NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS Retailer_Bushels,
-                            SUM(CASE WHEN c.SupplierID = 'C' AND ci.ci_score_final_gc02e_per_bu IS NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS NoScoreGrower_Bushels,
-                            SUM(CASE WHEN c.SupplierID = 'G' AND ci.ci_score_final_gc02e_per_bu IS NULL THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS NoScoreRetailer_Bushels,
-                            SUM(CASE WHEN c.SupplierID NOT IN ('C', 'G') THEN CAST(c.SuppliedQuantity AS DOUBLE) ELSE 0.0 END) AS Other_Bushels,
-                            SUM(CAST(c.SuppliedQuantity AS DOUBLE)) AS TotalBushels_Plant
-                        FROM
-                            gold.contractdata c
-                        INNER JOIN
-                            gold.plant_master pm ON pm.PlantId = c.PlantID
-                        LEFT OUTER JOIN
-                            bronze.cultura_ci ci ON ci.producer_id = c.NameID
-                        GROUP BY
-                            pm.PlantName
-                    )
-                    SELECT
-                        PlantName,
-                        ROUND((Grower_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS Grower_Percentage,
-                        ROUND((Retailer_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS Retailer_Percentage,
-                        ROUND((NoScoreGrower_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS NoScoreGrower_Percentage,
-                        ROUND((NoScoreRetailer_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS NoScoreRetailer_Percentage,
-                        ROUND((Other_Bushels * 100.0) / NULLIF(TotalBushels_Plant, 0), 2) AS Other_Percentage
-                    FROM
-                        CustomerTypeBushels
-                    ORDER BY
-                        PlantName;
-                """)
-
-                result = cursor.fetchall()
-                response_data = [
-                    {
-                        "plant_name": row[0],
-                        "grower_percentage": row[1],
-                        "retailer_percentage": row[2],
-                        "no_score_grower_percentage": row[3],
-                        "no_score_retailer_percentage": row[4],
-                        "other_percentage": row[5]
-                    }
-                    for row in result if len(row) >= 6
-                ]
+        if ANALYTICS_ENABLED:
+            result = analytics.get().plant_percentages(g.plantid)
+        else:
+            scope, params = plant_filter("c.PlantID", g.plantid)
+            _, result = fetch_all(PLANTS_CI_SCORE_LEVEL_SQL.format(scope=scope), params)
+
+        response_data = [
+            {
+                "plant_name": row[0],
+                "grower_percentage": row[1],
+                "retailer_percentage": row[2],
+                "no_score_grower_percentage": row[3],
+                "no_score_retailer_percentage": row[4],
+                "other_percentage": row[5]
+            }
+            for row in result if len(row) >= 6
+        ]
 
         return jsonify(response_data)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500    
+        return server_error(e)    
     
 
-@app.route('/sourcing/sources', methods=['GET'])
+SOURCES_SQL = """
+    SELECT
+        p.Name,
+        p.Type,
+        SUM(cq.QtyOfBushels) AS Bushels,
+        (SUM(cq.QtyOfBushels) * 100.0 / SUM(SUM(cq.QtyOfBushels)) OVER ()) AS PercentOfTotal,
+        ci.ci_score_final_gc02e_per_MJ    
+    FROM
+        gold.producer p
+    INNER JOIN
+        gold.contract c ON p.NameID = c.NameID
+    INNER JOIN
+        gold.contractqty cq ON cq.ContractID = c.ContractID
+    INNER JOIN
+        bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
+    {scope}
+    GROUP BY
+        p.Name,
+        p.Type,
+        ci.ci_score_final_gc02e_per_MJ;
+"""
+
+def source_item(row):
+    if len(row) < 5:
+        return None
+    return {
+        "source": row[0],
+        "type": row[1],
+        "bushels": row[2],
+        "percent_of_total": row[3],
+        "ci_score_per_MJ": row[4]
+    }
+
+# Paged variant of SOURCES_SQL (?limit=&after=&sort=&type=). Filtering, ordering
+# and the keyset predicate all run in the warehouse; PercentOfTotal divides by the
+# overall total, which is computed once and cached rather than re-windowed per page.
+SOURCES_PAGE_SQL = """
+    WITH sources AS (
+        SELECT
+            p.Name,
+            p.Type,
+            SUM(cq.QtyOfBushels) AS Bushels,
+            ci.ci_score_final_gc02e_per_MJ AS CIScore
+        FROM
+            gold.producer p
+        INNER JOIN
+            gold.contract c ON p.NameID = c.NameID
+        INNER JOIN
+            gold.contractqty cq ON cq.ContractID = c.ContractID
+        INNER JOIN
+            bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
+        {filters}
+        GROUP BY
+            p.Name,
+            p.Type,
+            ci.ci_score_final_gc02e_per_MJ
+    )
+    SELECT Name, Type, Bushels, Bushels * 100.0 / NULLIF(?, 0) AS PercentOfTotal, CIScore, {key_columns}
+    FROM sources
+    {where}
+    ORDER BY {order}
+    LIMIT {limit}
+"""
+
+SOURCES_TOTAL_SQL = """
+    SELECT SUM(cq.QtyOfBushels)
+    FROM
+        gold.producer p
+    INNER JOIN
+        gold.contract c ON p.NameID = c.NameID
+    INNER JOIN
+        gold.contractqty cq ON cq.ContractID = c.ContractID
+    INNER JOIN
+        bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
+    {scope}
+"""
+
+# Sort keys must be non-null for the keyset comparison; (Name, Type, CIScore) is
+# the grouping key, so appending it as a tie-breaker makes every position unique.
+SOURCES_SORT_KEYS = {
+    "name": "COALESCE(Name, '')",
+    "bushels": "COALESCE(Bushels, 0)",
+    "ci_score": "COALESCE(CIScore, -1e18)",
+}
+SOURCES_TIEBREAKERS = ["COALESCE(Name, '')", "COALESCE(Type, '')", "COALESCE(CIScore, -1e18)"]
+
+def sources_total_bushels(plantid=None):
+    scope, params = plant_filter("c.PlantID", plantid)
+    return get_or_compute(
+        result_cache, ("sources-total-bushels", plantid), lambda: fetch_all(SOURCES_TOTAL_SQL.format(scope=scope), params)[1][0][0],
+        CACHE_TTLS["sourcing-sources"], tags=("sourcing",)
+    )
+
+def sources_page():
+    limit = paging.parse_limit(request.args.get("limit"))
+    field, descending = paging.parse_sort(request.args.get("sort"), SOURCES_SORT_KEYS, "name")
+    primary = SOURCES_SORT_KEYS[field]
+    keys = [primary] + [k for k in SOURCES_TIEBREAKERS if k != primary]
+
+    total = sources_total_bushels(g.plantid)
+    filters, params = plant_filter("c.PlantID", g.plantid, *(["p.Type = ?"] if request.args.get("type") else []))
+    if request.args.get("type"):
+        params.append(request.args["type"])
+    params.append(total)
+    where = ""
+    if request.args.get("after"):
+        predicate, cursor_params = paging.keyset_predicate(
+            keys, paging.decode_cursor(request.args["after"], len(keys)), descending
+        )
+        where = f"WHERE {predicate}"
+        params.extend(cursor_params)
+
+    _, rows = fetch_all(SOURCES_PAGE_SQL.format(
+        filters=filters,
+        key_columns=", ".join(f"{k} AS _k{i}" for i, k in enumerate(keys)),
+        where=where,
+        order=paging.order_by(keys, descending),
+        limit=limit + 1,
+    ), params)
+
+    page, has_more = rows[:limit], len(rows) > limit
+    return jsonify({
+        "items": [source_item(row[:5]) for row in page],
+        "next": paging.encode_cursor(page[-1][5:]) if has_more else None,
+        "total_bushels": total
+    })
+
+@routes.route('/sourcing/sources', methods=['GET'])
+@cached("sourcing-sources", tags=("sourcing",))
 def producer_bushels_with_ci():
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT
-                        p.Name,
-                        p.Type,
-                        SUM(cq.QtyOfBushels) AS Bushels,
-                        (SUM(cq.QtyOfBushels) * 100.0 / SUM(SUM(cq.QtyOfBushels)) OVER ()) AS PercentOfTotal,
-                        ci.ci_score_final_gc02e_per_MJ    
-                    FROM
-                        gold.producer p
-                    INNER JOIN
-                        gold.contract c ON p.NameID = c.NameID
-                    INNER JOIN
-                        gold.contractqty cq ON cq.ContractID = c.ContractID
-                    INNER JOIN
-                        bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
-                    GROUP BY
-                        p.Name,
-                        p.Type,
-                        ci.ci_score_final_gc02e_per_MJ;
-                """)
-
-                result = cursor.fetchall()
-                response_data = [
-                    {
-                        "source": row[0],
-                        "type": row[1],
-                        "bushels": row[2],
-                        "percent_of_total": row[3],
-                        "ci_score_per_MJ": row[4]
-                    }
-                    for row in result if len(row) >= 5
-                ]
+        if any(p in request.args for p in ("limit", "after", "sort", "type")):
+            return sources_page()
+        scope, params = plant_filter("c.PlantID", g.plantid)
+        query = SOURCES_SQL.format(scope=scope)
+        if wants_columnar():
+            return columnar_response(query, params, names=["source", "type", "bushels", "percent_of_total", "ci_score_per_MJ"])
+        if wants_stream():
+            return stream_json(query, params, to_item=source_item)
+
+        if ANALYTICS_ENABLED:
+            result = analytics.get().sources(g.plantid)
+        else:
+            _, result = fetch_all(query, params)
+        response_data = [item for item in map(source_item, result) if item is not None]
 
         return jsonify(response_data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
     
-@app.route('/sourcing/opportunites-map', methods=['GET'])
+PRODUCER_LOCATIONS_SQL = """
+    SELECT
+        p.Name,
+        p.Type,
+        CASE 
+            WHEN p.Lat IS NULL THEN ci.latitude
+            ELSE p.Lat
+        END AS latitude,
+        CASE 
+            WHEN p.Lon IS NULL THEN ci.longitude
+            ELSE p.Lon
+        END AS longitude,
+        ci.ci_score_final_gc02e_per_MJ
+    FROM
+        gold.producer p
+    INNER JOIN
+        bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
+"""
+
+def producer_location_item(row):
+    if len(row) != 5:
+        return None
+    return {
+        "name": row[0],
+        "type": row[1],
+        "latitude": row[2],
+        "longitude": row[3],
+        "ci_score": row[4]
+    }
+
+@routes.route('/sourcing/opportunites-map', methods=['GET'])
+@cached("opportunities-map", tags=("sourcing",))
 def producer_location_ci():
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT
-                        p.Name,
-                        p.Type,
-                        CASE 
-                            WHEN p.Lat IS NULL THEN ci.latitude
-                            ELSE p.Lat
-                        END AS latitude,
-                        CASE 
-                            WHEN p.Lon IS NULL THEN ci.longitude
-                            ELSE p.Lon
-                        END AS longitude,
-                        ci.ci_score_final_gc02e_per_MJ
-                    FROM
-                        gold.producer p
-                    INNER JOIN
-                        bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
-                """)
-                
-                rows = cursor.fetchall()
-
-                result = [
-                    {
-                        "name": row[0],
-                        "type": row[1],
-                        "latitude": row[2],
-                        "longitude": row[3],
-                        "ci_score": row[4]
-                    }
-                    for row in rows if len(row) == 5
-                ]
+        if wants_columnar():
+            return columnar_response(PRODUCER_LOCATIONS_SQL, names=["name", "type", "latitude", "longitude", "ci_score"])
+        if wants_stream():
+            return stream_json(PRODUCER_LOCATIONS_SQL, to_item=producer_location_item)
+
+        _, rows = fetch_all(PRODUCER_LOCATIONS_SQL)
+        result = [item for item in map(producer_location_item, rows) if item is not None]
 
         return jsonify(result)
     
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
+
+# Producer locations with CI score and contracted bushels, held in memory for the
+# map tile API so pans and zooms never go back to the warehouse.
+PRODUCER_INDEX_SQL = """
+    SELECT
+        p.Name,
+        p.Type,
+        CASE 
+            WHEN p.Lat IS NULL THEN ci.latitude
+            ELSE p.Lat
+        END AS latitude,
+        CASE 
+            WHEN p.Lon IS NULL THEN ci.longitude
+            ELSE p.Lon
+        END AS longitude,
+        ci.ci_score_final_gc02e_per_MJ,
+        b.Bushels
+    FROM
+        gold.producer p
+    INNER JOIN
+        bronze.cultura_ci ci ON ci.producer_id = p.ERPNameID
+    LEFT OUTER JOIN (
+        SELECT c.NameID, SUM(cq.QtyOfBushels) AS Bushels
+        FROM gold.contract c
+        INNER JOIN gold.contractqty cq ON cq.ContractID = c.ContractID
+        GROUP BY c.NameID
+    ) b ON b.NameID = p.NameID
+"""
+
+producer_index = RefreshingValue(
+    lambda: ProducerIndex.from_table(fetch_table(PRODUCER_INDEX_SQL)),
+    ttl=float(os.getenv("PRODUCER_INDEX_TTL", 900)),
+    name="producer-index",
+    version=lambda: data_version(("sourcing",)),
+)
 
+def parse_bbox(value):
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox min values must not exceed max values")
+    return min_lon, min_lat, max_lon, max_lat
+
+# Viewport API: /sourcing/opportunites-map/tiles?bbox=minLon,minLat,maxLon,maxLat&zoom=6[&type=G]
+@routes.route('/sourcing/opportunites-map/tiles', methods=['GET'])
+def producer_location_tiles():
+    try:
+        bbox = parse_bbox(request.args.get("bbox"))
+        zoom = int(request.args.get("zoom", 4))
+        if zoom < 0 or zoom > MAX_ZOOM:
+            return jsonify({"error": f"zoom must be between 0 and {MAX_ZOOM}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    try:
+        cell_size, clusters = producer_index.get().clusters(*bbox, zoom, producer_type=request.args.get("type"))
+        return jsonify({
+            "zoom": zoom,
+            "cell_size_deg": cell_size,
+            "producers": sum(c["count"] for c in clusters),
+            "clusters": clusters
+        })
+    except Exception as e:
+        return server_error(e)
+
+PLANT_LOCATIONS_SQL = """
+    SELECT PlantId, PlantName, Lat, Lon
+    FROM gold.plant_master
+"""
+
+def load_plant_locations():
+    _, rows = fetch_all(PLANT_LOCATIONS_SQL)
+    return {str(row[0]): {"plant_name": row[1], "latitude": row[2], "longitude": row[3]} for row in rows}
+
+plant_locations = RefreshingValue(load_plant_locations, ttl=float(os.getenv("PRODUCER_INDEX_TTL", 900)), name="plant-locations",
+                                  version=lambda: data_version(("sourcing",)))
+
+# Lowest-CI producers around a plant (or any point), served from the in-memory index:
+# /sourcing/nearby-producers?plantid=..|lat=..&lon=..  [&radius_km=80] [&k=20] [&type=G] [&limit=100]
+# radius_km alone returns everything in the radius, k alone the k nearest, both the
+# k nearest within the radius; either way results are ranked by CI score.
+@routes.route('/sourcing/nearby-producers', methods=['GET'])
+def nearby_low_ci_producers():
+    try:
+        plant = None
+        if request.args.get("plantid"):
+            plant = plant_locations.get().get(request.args["plantid"])
+            if not plant or plant["latitude"] is None or plant["longitude"] is None:
+                return jsonify({"error": "Plant not found or has no location"}), 404
+            lat, lon = float(plant["latitude"]), float(plant["longitude"])
+        elif request.args.get("lat") and request.args.get("lon"):
+            lat, lon = float(request.args["lat"]), float(request.args["lon"])
+        else:
+            return jsonify({"error": "Provide plantid or lat and lon"}), 400
+
+        radius_km = float(request.args["radius_km"]) if request.args.get("radius_km") else None
+        k = int(request.args["k"]) if request.args.get("k") else None
+        limit = paging.parse_limit(request.args.get("limit"))
+        if (radius_km is not None and radius_km <= 0) or (k is not None and k <= 0):
+            return jsonify({"error": "radius_km and k must be positive"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        index = producer_index.get()
+        producer_type = request.args.get("type")
+        if radius_km is not None and k is None:
+            idx, dist = index.radius(lat, lon, radius_km, producer_type)
+        else:
+            idx, dist = index.nearest(lat, lon, k or 20, max_km=radius_km, producer_type=producer_type)
 
-@app.route('/setting/manual-input', methods=['GET', 'POST'])
+        return jsonify({
+            "plant": plant,
+            "latitude": lat,
+            "longitude": lon,
+            "producers": index.ranked_by_ci(idx, dist, limit=limit)
+        })
+    except Exception as e:
+        return server_error(e)
+
+
+
+# Columns of gold.plantinfo written by the manual-input endpoints, in insert order
+PLANTINFO_FIELDS = [
+     "plantid", "totalbushelsprocessed", "totalethanolproduced",
+    "gridelectricusage", "renewablelectricusage", "fossilgasused", "coalusage",
+    "naturalgasrenewable45z", "convefficiency", "fromdate", "todate",  "createdby"
+]
+PLANTINFO_NUMERIC_FIELDS = [
+    "totalbushelsprocessed", "totalethanolproduced", "gridelectricusage", "renewablelectricusage",
+    "fossilgasused", "coalusage", "naturalgasrenewable45z", "convefficiency"
+]
+
+@routes.route('/setting/manual-input', methods=['GET', 'POST'])
+@cached("manual-input", tags=("plantinfo",))
 def manual_input_handler():
     if request.method == 'GET':
-        plant_id = request.args.get('plantid')  # Get plantid from query string if provided
-        print("Received GET request with plantid:", plant_id)
-
         try:
-            with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-                with connection.cursor() as cursor:
-                    if plant_id:
-                        # print("Received GET request with plantid:", plant_id)
-                        query = "SELECT * FROM gold.plantinfo WHERE plantid = ?"
-                        cursor.execute(query, (plant_id,))
-                    else:
-                        # print("Received GET request without plantid")
-                        query = "SELECT * FROM gold.plantinfo"
-                        cursor.execute(query)
-
-                    rows = cursor.fetchall()
-                    columns = [desc[0] for desc in cursor.description]
-                    result = [dict(zip(columns, row)) for row in rows]
-                    return jsonify(result)
+            plant_id = scoped_plantid(request.args.get('plantid'))  # from the query string, or the user's own plant
+            print("Received GET request with plantid:", plant_id)
+
+            if plant_id:
+                # print("Received GET request with plantid:", plant_id)
+                query = "SELECT * FROM gold.plantinfo WHERE plantid = ?"
+                if wants_columnar():
+                    return columnar_response(query, (plant_id,))
+                columns, rows = fetch_all(query, (plant_id,))
+            else:
+                # print("Received GET request without plantid")
+                query = "SELECT * FROM gold.plantinfo"
+                if wants_columnar():
+                    return columnar_response(query)
+                if wants_stream():
+                    return stream_json(query)
+                columns, rows = fetch_all(query)
+
+            result = [dict(zip(columns, row)) for row in rows]
+            return jsonify(result)
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
+            return server_error(e)
 
     elif request.method == 'POST':
         print("Received POST request" + str(request.get_json()))
@@ -640,16 +1551,15 @@ def manual_input_handler():
             data = request.get_json()
 
             # Validate required fields (you can customize as needed)
-            required_fields = [
-                 "plantid", "totalbushelsprocessed", "totalethanolproduced",
-                "gridelectricusage", "renewablelectricusage", "fossilgasused", "coalusage",
-                "naturalgasrenewable45z", "convefficiency", "fromdate", "todate",  "createdby"
-            ]
+            required_fields = PLANTINFO_FIELDS
             for field in required_fields:
                 if field not in data:
                     return jsonify({"error": f"Missing field: {field}"}), 400
 
-            with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
+            if wants_async():
+                return queued_response(write_queue.enqueue("plantinfo", [tuple(data[f] for f in PLANTINFO_FIELDS)]))
+
+            with pool.connection() as connection:
                 with connection.cursor() as cursor:
                     cursor.execute("""
                         INSERT INTO gold.plantinfo (
@@ -674,29 +1584,242 @@ def manual_input_handler():
                         data["createdby"]
                     ))
 
+            # Plant inputs feed the dashboard figures as well as the plantinfo listing
+            invalidate_cached("plantinfo", "dashboard")
             return jsonify({"status": "Manual plant input inserted successfully ✅"})
 
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
+            return server_error(e)
         
-@app.route('/setting/business-rules', methods=['GET'])
-def business_rules_handler():
+# Bulk import of plant manual inputs from a spreadsheet (multipart field "file", .xlsx
+# or .csv, one row per period, headers matching the plantinfo columns). Optional form
+# fields: createdby (used where the sheet has no createdby value) and dry_run=1 to
+# validate without writing.
+@routes.route('/setting/manual-input/import', methods=['POST'])
+def manual_input_import():
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        return jsonify({"error": "Missing file"}), 400
+
     try:
-        with sql.connect(server_hostname=HOST, http_path=HTTP_PATH, access_token=ACCESS_TOKEN) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    select p.Name from gold.ciscore as ci inner join gold.producer as p on ci.nameid=p.NameID where p.Type='G'
-                """)
-                
-                rows = cursor.fetchall()  # [(name1,), (name2,), ...]
+        frame = spreadsheets.read_sheet(upload.stream, upload.filename)
+        defaults = {"createdby": request.form["createdby"]} if request.form.get("createdby") else None
+        rows, errors = spreadsheets.validate(
+            frame, PLANTINFO_FIELDS,
+            numeric=PLANTINFO_NUMERIC_FIELDS,
+            dates=["fromdate", "todate"],
+            date_ranges=[("fromdate", "todate")],
+            defaults=defaults,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Could not read spreadsheet: {e}"}), 400
+
+    result = {
+        "received": len(frame),
+        "valid": len(rows),
+        "rejected_rows": len({e["row"] for e in errors}),
+        "errors": errors[:spreadsheets.MAX_REPORTED_ERRORS],
+        "errors_truncated": len(errors) > spreadsheets.MAX_REPORTED_ERRORS,
+    }
+    if request.form.get("dry_run", "").lower() in ("1", "true", "yes") or not rows:
+        result["inserted"] = 0
+        return jsonify(result), 200 if rows or not len(frame) else 400
 
-                # Print formatted for debug like Row(Name='...')
-                print([f"Row(Name='{row[0]}')" for row in rows])
+    try:
+        failed = insert_rows(pool, "gold.plantinfo", PLANTINFO_FIELDS, rows, BULK_INSERT_BATCH_SIZE)
+    except Exception as e:
+        if getattr(e, "written", None):  # a TransientWriteError after some batches landed
+            invalidate_cached("plantinfo", "dashboard")
+        return server_error(e)
+
+    result["errors"] = sorted(result["errors"] + [{"row": n, "column": None, "error": e, "value": None} for n, e in failed.items()],
+                              key=lambda e: e["row"])[:spreadsheets.MAX_REPORTED_ERRORS]
+    result["rejected_rows"] += len(failed)
+    result["inserted"] = len(rows) - len(failed)
+    if result["inserted"]:
+        invalidate_cached("plantinfo", "dashboard")
+    return jsonify(result)
+
+# -------------------- WRITE-BEHIND QUEUE --------------------
+
+# /insert-user and POST /setting/manual-input take ?async=1 (or "Prefer: respond-async"):
+# the validated row is journaled locally and acknowledged with 202 and a job id, and a
+# background worker writes it to the warehouse in coalesced batches with retries.
+
+# kind -> (table, columns in insert order, cache tags to drop once rows land)
+WRITE_TARGETS = {
+    "customer": ("gage_dev_databricks.gold_layer.customer", CUSTOMER_FIELDS, ("customer",)),
+    "plantinfo": ("gold.plantinfo", PLANTINFO_FIELDS, ("plantinfo", "dashboard")),
+}
+
+def write_behind(kind, rows):
+    table, fields, tags = WRITE_TARGETS[kind]
+    try:
+        failed = insert_rows(pool, table, fields, rows, BULK_INSERT_BATCH_SIZE)
+    except TransientWriteError as e:
+        if e.written:
+            invalidate_cached(*tags)
+        raise  # the queue settles e.written / e.errors and retries the rest
+    if len(failed) < len(rows):
+        invalidate_cached(*tags)
+    return failed
+
+write_queue = WriteQueue(
+    os.getenv("WRITE_QUEUE_PATH", "write_queue.db"),
+    write_behind,
+    max_rows=int(os.getenv("WRITE_QUEUE_MAX_ROWS", 500)),
+    max_attempts=int(os.getenv("WRITE_QUEUE_MAX_ATTEMPTS", 5)),
+    backoff_seconds=float(os.getenv("WRITE_QUEUE_BACKOFF", 2)),
+    claim_timeout=float(os.getenv("WRITE_QUEUE_CLAIM_TIMEOUT", 900)),
+)
 
-                # Return as plain JSON
-                return jsonify([{"Name": row[0]} for row in rows])
+def wants_async():
+    if request.args.get("async", "").lower() in ("1", "true", "yes"):
+        return True
+    return "respond-async" in request.headers.get("Prefer", "")
+
+def queued_response(job_id):
+    return jsonify({
+        "status": "queued",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
+    }), 202
+
+@routes.route('/jobs/<job_id>', methods=['GET'])
+def write_job_status(job_id):
+    if not os.path.exists(write_queue.path):
+        return jsonify({"error": "Job not found"}), 404
+    job = write_queue.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@routes.route('/write-queue-stats')
+def write_queue_stats():
+    return jsonify(write_queue.stats())
+
+# -------------------- EXPORTS --------------------
+
+# dataset -> (query, header, plant column for its {scope}); a None header uses the
+# warehouse column names
+EXPORTS = {
+    "sources": (SOURCES_SQL, ["source", "type", "bushels", "percent_of_total", "ci_score_per_MJ"], "c.PlantID"),
+    "plants-ci-score-level": (PLANTS_CI_SCORE_LEVEL_SQL, [
+        "plant_name", "grower_percentage", "retailer_percentage",
+        "no_score_grower_percentage", "no_score_retailer_percentage", "other_percentage"
+    ], "c.PlantID"),
+    "plantinfo": ("SELECT * FROM gold.plantinfo {scope}", None, "plantid"),
+}
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# /export/sources.csv, /export/plants-ci-score-level.xlsx, /export/plantinfo.csv [?plantid=..]
+# Rows are written out batch by batch as they are fetched: CSV starts downloading
+# with the first batch; xlsx is spooled through openpyxl's write-only mode and a
+# temp file, so neither holds the full result in memory.
+@routes.route('/export/<dataset>.<fmt>', methods=['GET'])
+def export_dataset(dataset, fmt):
+    if dataset not in EXPORTS or fmt not in ("csv", "xlsx"):
+        return jsonify({"error": f"Unknown export: {dataset}.{fmt}"}), 404
+
+    query, header, plant_column = EXPORTS[dataset]
+    scope, params = plant_filter(plant_column, scoped_plantid(request.args.get("plantid")))
+    query = query.format(scope=scope)
+
+    try:
+        batches = iter_batches(pool, query, params, STREAM_BATCH_SIZE)
+        columns = next(batches)  # runs the statement now so errors still become a 500
+        header = header or columns
+    except Exception as e:
+        return server_error(e)
+
+    filename = f"{dataset}.{fmt}"
+    if fmt == "csv":
+        def generate():
+            try:
+                yield from spreadsheets.csv_chunks(header, batches)
+            finally:
+                batches.close()
+
+        response = Response(generate(), mimetype="text/csv",
+                            headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+        response.call_on_close(batches.close)  # covers a body that is never iterated
+        return response
+
+    spool = tempfile.TemporaryFile()
+    try:
+        spreadsheets.write_xlsx(spool, dataset, header, batches)
+    except Exception as e:
+        spool.close()
+        return server_error(e)
+    finally:
+        batches.close()
+    spool.seek(0)
+    return send_file(spool, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+
+BUSINESS_RULE_PRODUCERS_SQL = """
+    select p.Name from gold.ciscore as ci inner join gold.producer as p on ci.nameid=p.NameID where p.Type='G'
+"""
+
+# Producer names for the business-rules settings, indexed for typeahead and
+# reloaded in the background every BUSINESS_RULES_INDEX_TTL seconds. A "sourcing"
+# invalidation makes the next read rebuild first, so the cached listing stored
+# under the new data version is never built from the old index.
+producer_names = RefreshingValue(
+    lambda: NameIndex(row[0] for row in fetch_all(BUSINESS_RULE_PRODUCERS_SQL)[1]),
+    ttl=float(os.getenv("BUSINESS_RULES_INDEX_TTL", 900)),
+    name="producer-names",
+    version=lambda: data_version(("sourcing",)),
+)
+
+@routes.route('/setting/business-rules', methods=['GET'])
+@cached("business-rules", tags=("sourcing",))
+def business_rules_handler():
+    try:
+        return jsonify([{"Name": name} for name in producer_names.get().names])
+    except Exception as e:
+        return server_error(e)
+
+# Typeahead: /setting/business-rules/search?q=ab[&limit=20][&match=auto|prefix|contains]
+# "auto" lists prefix matches first, then names containing q elsewhere; case-insensitive
+@routes.route('/setting/business-rules/search', methods=['GET'])
+def business_rules_search():
+    match = request.args.get("match", "auto")
+    if match not in ("auto", "prefix", "contains"):
+        return jsonify({"error": "match must be one of auto, prefix, contains"}), 400
+    try:
+        limit = int(request.args.get("limit", TYPEAHEAD_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1 or limit > TYPEAHEAD_MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {TYPEAHEAD_MAX_LIMIT}"}), 400
+
+    try:
+        names = producer_names.get().search(request.args.get("q", ""), limit, match)
+        return jsonify([{"Name": name} for name in names])
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return server_error(e)
+
+def create_app(prefetch_secrets=True):
+    app = Flask(__name__)
+    app.json = TimedJSONProvider(app)
+    CORS(app, supports_credentials=True, origins=[FrontendOrigin])
+    app.register_blueprint(routes)
+    if prefetch_secrets:
+        # Warm the secret cache in the background; the first request only waits if it isn't done yet
+        secret_provider.prefetch()
+    if ANALYTICS_ENABLED:
+        analytics.prefetch()
+    if KEEP_WARM_ENABLED:
+        keep_warm.start()
+    if os.path.exists(write_queue.path):
+        # Resume draining anything journaled before a restart
+        write_queue.start()
+    return app
+
+app = create_app()
+
 # Run app
 if __name__ == '__main__':
     app.run(debug=True, port=3000, host="localhost")
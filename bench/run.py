@@ -0,0 +1,334 @@
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Offline benchmark: serves the app over HTTP against a seeded SQLite stand-in for
+# the warehouse (bench/stubs/databricks) with stubbed secrets, drives each route
+# with concurrent clients and reports latency percentiles, throughput and peak RSS.
+#
+#   python bench/run.py [--scale 1] [--concurrency 8] [--requests 200]
+#                       [--query-latency 0.05] [--no-cache] [--only sourcing,dashboard]
+#                       [--json results.json] [--baseline results.json --tolerance 0.25]
+#
+# With --baseline the run fails (exit 1) if any route's p95 is more than
+# `tolerance` slower than in the baseline file.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, os.path.join(BENCH_DIR, "stubs"))
+
+import seed  # noqa: E402
+
+# Routes deliberately left out, with the reason
+SKIPPED = {
+    "/delete-user": "deletes every user with a role",
+    "/api/reset-password-request": "sends email",
+    "/cache/invalidate": "would reset the caches other scenarios measure",
+}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the lifetime peak (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+class Client:
+    # One keep-alive HTTP connection per load-generator thread
+    def __init__(self, port):
+        self.port = port
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            data = response.read()
+            return response.status, data
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+def json_body(payload):
+    return json.dumps(payload).encode(), {"Content-Type": "application/json"}
+
+
+def multipart_csv(name, filename, text, fields):
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n' for k, v in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f"Content-Type: text/csv\r\n\r\n{text}\r\n--{boundary}--\r\n")
+    return "".join(parts).encode(), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def scenarios(app_module, client, plants):
+    # (name, route rule, method, path, body factory) - body factories return (bytes, headers)
+    status, data = client.request("POST", "/api/login", *json_body({"email": seed.BENCH_USER[0], "password": seed.BENCH_USER[1]}))
+    if status != 200:
+        raise RuntimeError(f"Bench login failed: {status} {data[:200]}")
+    login = json.loads(data)
+    _, data = client.request("POST", "/api/login", *json_body({"email": seed.BENCH_PLANT_USER[0], "password": seed.BENCH_PLANT_USER[1]}))
+    plant_token = json.loads(data)["token"]
+
+    auth = {"Authorization": f"Bearer {login['token']}"}
+    plant_auth = {"Authorization": f"Bearer {plant_token}"}
+    counter = iter(range(10 ** 9))
+
+    def user_record():
+        n = next(counter)
+        record = {f: f"{f}-bench-{n}" for f in app_module.CUSTOMER_FIELDS}
+        record.update(customerid=1000000 + n, userid=1000000 + n, plantid=1, email=f"bench{n}@example.com")
+        return record
+
+    def plantinfo_record():
+        record = {f: 1.0 for f in app_module.PLANTINFO_FIELDS}
+        record.update(plantid=1, fromdate="2025-01-01", todate="2025-01-31", createdby="bench")
+        return record
+
+    csv_text = ",".join(app_module.PLANTINFO_FIELDS) + "\n" + "\n".join(
+        ",".join(str(v) for v in plantinfo_record().values()) for _ in range(50))
+
+    _, data = client.request("POST", "/insert-user?async=1", *json_body(user_record()))
+    job_id = json.loads(data)["job_id"]
+
+    get = lambda headers=None: (lambda: (None, headers or {}))
+
+    def revalidate(path):
+        # Conditional GET with the ETag of a first fetch: a polling client's steady state
+        connection = http.client.HTTPConnection("127.0.0.1", client.port, timeout=120)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        return get({"If-None-Match": response.getheader("ETag", "")})
+
+    bbox = "-104,36,-84,48"
+    return [
+        ("home", "/", "GET", "/", get()),
+        ("test-connection", "/test-connection", "GET", "/test-connection", get()),
+        ("ready", "/ready", "GET", "/ready", get()),
+        ("metrics", "/metrics", "GET", "/metrics", get()),
+        ("pool-stats", "/pool-stats", "GET", "/pool-stats", get()),
+        ("cache-stats", "/cache-stats", "GET", "/cache-stats", get()),
+        ("admission-stats", "/admission-stats", "GET", "/admission-stats", get()),
+        ("write-queue-stats", "/write-queue-stats", "GET", "/write-queue-stats", get()),
+        ("data", "/data", "GET", "/data", get()),
+        ("data-page", "/data", "GET", "/data?limit=100", get()),
+        ("login", "/api/login", "POST", "/api/login",
+         lambda: json_body({"email": seed.BENCH_USER[0], "password": seed.BENCH_USER[1]})),
+        ("protected", "/api/protected", "GET", "/api/protected", get(auth)),
+        ("refresh", "/api/refresh", "POST", "/api/refresh", lambda: json_body({"refresh_token": login["refresh_token"]})),
+        ("dashboard-metrics", "/api/dashboard-metrics", "GET", "/api/dashboard-metrics", get()),
+        ("dashboard-metrics (plant)", "/api/dashboard-metrics", "GET", "/api/dashboard-metrics", get(plant_auth)),
+        ("summary-metrics", "/dashboard/summary-metrics", "GET", "/dashboard/summary-metrics", get()),
+        ("contract-ci-score-level", "/dashboard/contract-ci-score-level", "GET", "/dashboard/contract-ci-score-level", get()),
+        ("contract-ci-score-level (304)", "/dashboard/contract-ci-score-level", "GET", "/dashboard/contract-ci-score-level",
+         revalidate("/dashboard/contract-ci-score-level")),
+        ("plants-ci-score-level", "/dashboard/plants-ci-score-level", "GET", "/dashboard/plants-ci-score-level", get()),
+        ("plants-ci-score-level (plant)", "/dashboard/plants-ci-score-level", "GET", "/dashboard/plants-ci-score-level", get(plant_auth)),
+        ("sources", "/sourcing/sources", "GET", "/sourcing/sources", get()),
+        ("sources (plant)", "/sourcing/sources", "GET", "/sourcing/sources", get(plant_auth)),
+        ("sources-page", "/sourcing/sources", "GET", "/sourcing/sources?limit=100&sort=-bushels", get()),
+        ("sources-stream", "/sourcing/sources", "GET", "/sourcing/sources?stream=1", get()),
+        ("sources-columnar", "/sourcing/sources", "GET", "/sourcing/sources", get({"Accept": app_module.COLUMNAR_JSON})),
+        ("opportunities-map", "/sourcing/opportunites-map", "GET", "/sourcing/opportunites-map", get()),
+        ("opportunities-map-arrow", "/sourcing/opportunites-map", "GET", "/sourcing/opportunites-map", get({"Accept": app_module.ARROW_STREAM})),
+        ("map-tiles", "/sourcing/opportunites-map/tiles", "GET", f"/sourcing/opportunites-map/tiles?bbox={bbox}&zoom=6", get()),
+        ("nearby-producers", "/sourcing/nearby-producers", "GET", "/sourcing/nearby-producers?plantid=1&k=20", get()),
+        ("manual-input", "/setting/manual-input", "GET", "/setting/manual-input", get()),
+        ("manual-input-plant", "/setting/manual-input", "GET", f"/setting/manual-input?plantid={plants}", get()),
+        ("manual-input-post", "/setting/manual-input", "POST", "/setting/manual-input", lambda: json_body(plantinfo_record())),
+        ("manual-input-import", "/setting/manual-input/import", "POST", "/setting/manual-input/import",
+         lambda: multipart_csv("file", "bench.csv", csv_text, {"createdby": "bench"})),
+        ("insert-user", "/insert-user", "POST", "/insert-user", lambda: json_body(user_record())),
+        ("insert-user-async", "/insert-user", "POST", "/insert-user?async=1", lambda: json_body(user_record())),
+        ("insert-users", "/insert-users", "POST", "/insert-users", lambda: json_body([user_record() for _ in range(50)])),
+        ("job-status", "/jobs/<job_id>", "GET", f"/jobs/{job_id}", get()),
+        ("business-rules", "/setting/business-rules", "GET", "/setting/business-rules", get()),
+        ("business-rules-search", "/setting/business-rules/search", "GET", "/setting/business-rules/search?q=00012&limit=10", get()),
+        ("export-sources-csv", "/export/<dataset>.<fmt>", "GET", "/export/sources.csv", get()),
+        ("export-plantinfo-xlsx", "/export/<dataset>.<fmt>", "GET", "/export/plantinfo.xlsx", get()),
+    ]
+
+
+def drive(client, method, path, body_factory, total, concurrency):
+    latencies, failures, shed = [], [], []
+    lock = threading.Lock()
+
+    def one(_):
+        body, headers = body_factory()
+        started = time.perf_counter()
+        try:
+            status, data = client.request(method, path, body, headers)
+        except Exception as e:
+            status, data = None, str(e).encode()
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status == 503:
+                shed.append(status)  # turned away by admission control or a pool timeout
+            elif status is None or status >= 400:
+                failures.append(f"{status}: {data[:200].decode(errors='replace')}")
+
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        list(executor.map(one, range(total)))
+        wall = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "errors": len(failures),
+        "shed": len(shed),
+        "first_error": failures[0] if failures else None,
+        "rps": round(total / wall, 1) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark against a seeded SQLite warehouse stand-in")
+    parser.add_argument("--scale", type=int, default=1, help="data scale (1 = 1,000 producers)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per scenario")
+    parser.add_argument("--query-latency", type=float, default=0.0, help="simulated seconds per statement")
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="simulated seconds per new session")
+    parser.add_argument("--no-cache", action="store_true", help="disable result caching (measure the query path)")
+    parser.add_argument("--only", help="comma-separated substrings; run only scenarios whose name matches")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="gage-bench-")
+    os.environ.update({
+        "BENCH_DATA_DIR": data_dir,
+        "BENCH_QUERY_LATENCY": str(args.query_latency),
+        "BENCH_CONNECT_LATENCY": str(args.connect_latency),
+        # Stubbed secrets: no vault, fixed values (load_dotenv never overrides these)
+        "KEY_VAULT_URL": "",
+        "DATABRICKS_HOST": "bench",
+        "DATABRICKS_HTTP_PATH": "bench",
+        "DATABRICKS_TOKEN": "bench",
+        "JWT_SECRET": "bench-secret",
+        "WRITE_QUEUE_PATH": os.path.join(data_dir, "write_queue.db"),
+        "DATA_VERSIONS_PATH": os.path.join(data_dir, "data_versions.db"),
+        "DB_POOL_SIZE": str(max(8, args.concurrency)),
+    })
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    with contextlib.redirect_stdout(sys.stderr):  # keep the app's debug prints out of the report
+        import app as app_module
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        sizes = seed.seed(data_dir, args.scale, app_module.CUSTOMER_FIELDS, app_module.PLANTINFO_FIELDS)
+        if args.no_cache:
+            for name in app_module.CACHE_TTLS:
+                app_module.CACHE_TTLS[name] = 0
+
+        class KeepAliveHandler(WSGIRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+        server = make_server("127.0.0.1", 0, app_module.app, threaded=True, request_handler=KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = Client(server.server_port)
+
+        plan = scenarios(app_module, client, sizes["plants"])
+        if args.only:
+            wanted = [w.strip() for w in args.only.split(",") if w.strip()]
+            plan = [s for s in plan if any(w in s[0] for w in wanted)]
+
+        covered = {s[1] for s in plan}
+        rules = {r.rule for r in app_module.app.url_map.iter_rules() if r.endpoint != "static"}
+        uncovered = sorted(rules - covered - set(SKIPPED))
+
+        results = {}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for name, _, method, path, body_factory in plan:
+                drive(client, method, path, body_factory, args.warmup, min(args.warmup, args.concurrency) or 1)
+                results[name] = drive(client, method, path, body_factory, args.requests, args.concurrency)
+        server.shutdown()
+
+    print(f"scale={args.scale} ({sizes['producers']} producers, {sizes['contracts']} contracts, {sizes['plants']} plants) "
+          f"concurrency={args.concurrency} requests={args.requests} query_latency={args.query_latency}s "
+          f"cache={'off' if args.no_cache else 'on'}")
+    print(f"{'scenario':32} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8} {'errors':>7} {'shed':>6}")
+    for name, r in results.items():
+        print(f"{name:32} {r['rps']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['peak_rss_mb']:>8} {r['errors']:>7} {r['shed']:>6}")
+        if r["first_error"]:
+            print(f"  first error: {r['first_error']}")
+    if uncovered and not args.only:
+        print(f"Routes without a scenario: {', '.join(uncovered)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "sizes": sizes, "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = [
+            f"{name}: p95 {r['p95_ms']}ms vs {baseline[name]['p95_ms']}ms"
+            for name, r in results.items()
+            if name in baseline and r["p95_ms"] > baseline[name]["p95_ms"] * (1 + args.tolerance)
+        ]
+        if regressions:
+            print("p95 regressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import datetime
+import os
+import random
+import sqlite3
+
+
+# Synthetic warehouse data for the benchmark suite, written to one SQLite file
+# per schema (see stubs/databricks/sql.py). Sizes grow linearly with `scale`:
+# scale 1 is 1,000 producers, 3,000 contracts and 12 plants.
+
+PRODUCERS_PER_SCALE = 1000
+CONTRACTS_PER_PRODUCER = 3
+QTY_ROWS_PER_CONTRACT = 2
+CUSTOMERS_PER_SCALE = 200
+
+BENCH_USER = ("bench@example.com", "bench")        # all plants
+BENCH_PLANT_USER = ("plant1@example.com", "bench")  # scoped to plant 1
+
+TABLES = {
+    "gold.plant_master": "PlantId INTEGER, PlantName TEXT, Lat REAL, Lon REAL",
+    "gold.producer": "NameID INTEGER, ERPNameID INTEGER, Name TEXT, Type TEXT, Lat REAL, Lon REAL",
+    "bronze.cultura_ci": "producer_id INTEGER, ci_score_final_gc02e_per_bu REAL, ci_score_final_gc02e_per_MJ REAL, latitude REAL, longitude REAL",
+    "gold.contract": "ContractID INTEGER, NameID INTEGER, PlantID INTEGER",
+    "gold.contractqty": "ContractID INTEGER, QtyOfBushels REAL",
+    "gold.contractdata": "ContractID INTEGER, NameID INTEGER, PlantID INTEGER, SupplierID TEXT, SuppliedQuantity REAL, RemainingQuantity REAL",
+    "gold.ciscore": "nameid INTEGER",
+    "gold.userinfo": "username TEXT, password TEXT, roleid INTEGER, erpid TEXT, plantid INTEGER",
+    "gold.rolemasterinfo": "roleid INTEGER, role TEXT",
+    "gold.dashboardinfo": "contractedciscore REAL, contractedbushels REAL, rebate REAL, authorizedgrowers REAL",
+    "gold_layer.metadata": "contractedciscore REAL, contractedbushels REAL, rebate REAL, authorizedgrowers REAL",
+}
+
+INDEXES = [
+    "gold.contract (NameID)",
+    "gold.contract (PlantID)",
+    "gold.contractqty (ContractID)",
+    "gold.contractdata (NameID)",
+    "gold.contractdata (PlantID)",
+    "bronze.cultura_ci (producer_id)",
+    "gold.producer (NameID)",
+    "gold.userinfo (username)",
+    "gold.plantinfo (plantid)",
+]
+
+
+def _connect(data_dir):
+    db = sqlite3.connect(":memory:", isolation_level=None)
+    for schema in ("gold", "bronze", "gold_layer"):
+        path = os.path.join(data_dir, f"{schema}.db")
+        db.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        db.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    return db
+
+
+def _insert(db, table, rows):
+    rows = list(rows)
+    if rows:
+        db.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in rows[0])})", rows)
+
+
+def seed(data_dir, scale, customer_fields, plantinfo_fields, seed=42):
+    # customer_fields / plantinfo_fields are the app's insert column lists, so the
+    # seeded tables always match what the write endpoints send.
+    rng = random.Random(seed)
+    db = _connect(data_dir)
+    db.execute("BEGIN")
+
+    tables = dict(TABLES)
+    tables["gold.plantinfo"] = ", ".join(plantinfo_fields)
+    tables["gold_layer.customer"] = ", ".join(customer_fields)
+    for table, columns in tables.items():
+        db.execute(f"CREATE TABLE {table} ({columns})")
+
+    plants = 10 + 2 * scale
+    producers = PRODUCERS_PER_SCALE * scale
+
+    plant_rows = [(p, f"Plant {p}", rng.uniform(37, 46), rng.uniform(-100, -86)) for p in range(1, plants + 1)]
+    _insert(db, "gold.plant_master", plant_rows)
+
+    producer_rows, ci_rows = [], []
+    for n in range(1, producers + 1):
+        lat, lon = rng.uniform(36, 48), rng.uniform(-104, -84)
+        located = rng.random() > 0.2  # the rest fall back to the CI table's coordinates
+        producer_rows.append((n, n, f"Producer {n:06d}", rng.choice("CG"),
+                              lat if located else None, lon if located else None))
+        if rng.random() < 0.85:
+            scored = rng.random() > 0.1
+            ci_rows.append((n, rng.uniform(5, 40) if scored else None, rng.uniform(20, 80) if scored else None, lat, lon))
+    _insert(db, "gold.producer", producer_rows)
+    _insert(db, "bronze.cultura_ci", ci_rows)
+    _insert(db, "gold.ciscore", ((n,) for n in range(1, producers + 1) if rng.random() < 0.5))
+
+    contract_rows, qty_rows, data_rows = [], [], []
+    contract_id = 0
+    for n in range(1, producers + 1):
+        for _ in range(CONTRACTS_PER_PRODUCER):
+            contract_id += 1
+            plant = rng.randint(1, plants)
+            contract_rows.append((contract_id, n, plant))
+            qty_rows.extend((contract_id, round(rng.uniform(500, 20000), 2)) for _ in range(QTY_ROWS_PER_CONTRACT))
+            supplied = round(rng.uniform(0, 50000), 2)
+            data_rows.append((contract_id, n, plant, rng.choice("CCGGX"), supplied, round(rng.uniform(0, supplied), 2)))
+    _insert(db, "gold.contract", contract_rows)
+    _insert(db, "gold.contractqty", qty_rows)
+    _insert(db, "gold.contractdata", data_rows)
+
+    start = datetime.date(2024, 1, 1)
+    plantinfo_rows = []
+    for p in range(1, plants + 1):
+        for month in range(12):
+            values = {
+                "plantid": p,
+                "fromdate": (start + datetime.timedelta(days=30 * month)).isoformat(),
+                "todate": (start + datetime.timedelta(days=30 * month + 29)).isoformat(),
+                "createdby": "seed",
+            }
+            plantinfo_rows.append(tuple(values.get(f, round(rng.uniform(0, 1e6), 2)) for f in plantinfo_fields))
+    _insert(db, "gold.plantinfo", plantinfo_rows)
+
+    customer_rows = []
+    for n in range(1, CUSTOMERS_PER_SCALE * scale + 1):
+        values = {"customerid": n, "userid": n, "plantid": rng.randint(1, plants), "email": f"user{n}@example.com"}
+        customer_rows.append(tuple(values.get(f, f"{f}-{n}") for f in customer_fields))
+    _insert(db, "gold_layer.customer", customer_rows)
+
+    _insert(db, "gold.rolemasterinfo", [(1, "admin"), (2, "plant")])
+    _insert(db, "gold.userinfo", [
+        (BENCH_USER[0], BENCH_USER[1], 1, None, None),
+        (BENCH_PLANT_USER[0], BENCH_PLANT_USER[1], 2, "ERP1", 1),
+    ])
+    summary = (31.5, 1.2e7, 0.12, 64.0)
+    _insert(db, "gold.dashboardinfo", [summary])
+    _insert(db, "gold_layer.metadata", [summary])
+
+    for index, target in enumerate(INDEXES):
+        schema, rest = target.split(".", 1)
+        table, columns = rest.split(" ", 1)
+        db.execute(f"CREATE INDEX {schema}.bench_idx_{index} ON {table} {columns}")
+
+    db.execute("COMMIT")
+    db.close()
+    return {"plants": plants, "producers": producers, "contracts": contract_id}
@@ -0,0 +1,76 @@
+import os
+import re
+import sqlite3
+import time
+
+
+# Stand-in for the databricks-sql-connector used by the benchmark suite. Each
+# session is an in-memory SQLite connection with one database file ATTACHed per
+# schema (gold, bronze, gold_layer), so "gold.contractdata" resolves as it does
+# in the warehouse. The little Databricks-only SQL the app uses is rewritten on
+# the way in. BENCH_CONNECT_LATENCY / BENCH_QUERY_LATENCY add a fixed delay per
+# session / statement to approximate a remote warehouse.
+
+SCHEMAS = ("gold", "bronze", "gold_layer")
+
+_REWRITES = [
+    (re.compile(r"\bgage_dev_databricks\."), ""),  # three-part names -> schema.table
+    (re.compile(r"\bAS\s+STRING\)", re.IGNORECASE), "AS TEXT)"),
+]
+
+
+def connect(server_hostname=None, http_path=None, access_token=None, **kwargs):
+    delay = float(os.getenv("BENCH_CONNECT_LATENCY", 0))
+    if delay:
+        time.sleep(delay)
+    return Connection(os.environ["BENCH_DATA_DIR"])
+
+
+class Connection:
+    def __init__(self, data_dir):
+        # Autocommit, like the warehouse; the busy timeout covers concurrent writers
+        self._db = sqlite3.connect(":memory:", timeout=30, isolation_level=None, check_same_thread=False)
+        for schema in SCHEMAS:
+            self._db.execute(f"ATTACH DATABASE ? AS {schema}", (os.path.join(data_dir, f"{schema}.db"),))
+
+    def cursor(self):
+        return Cursor(self._db.cursor())
+
+    def close(self):
+        self._db.close()
+
+
+class Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, operation, parameters=None):
+        delay = float(os.getenv("BENCH_QUERY_LATENCY", 0))
+        if delay:
+            time.sleep(delay)
+        for pattern, replacement in _REWRITES:
+            operation = pattern.sub(replacement, operation)
+        self._cursor.execute(operation, list(parameters or []))
+        return self
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1000):
+        return self._cursor.fetchmany(size)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        self._cursor.close()
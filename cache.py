@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+MISS = object()
+
+
+# Size-bounded LRU with per-entry TTLs. Entries carry tags (e.g. the tables
+# they were read from) so writes can drop exactly the results they affect.
+
+class ResultCache:
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl, tags=()):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl, frozenset(tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def get_or_compute(self, key, compute, ttl, tags=()):
+        value = self.get(key)
+        if value is MISS:
+            value = compute()
+            self.set(key, value, ttl, tags)
+        return value
+
+    def invalidate(self, *tags):
+        # No tags clears everything (e.g. after a batch load)
+        with self._lock:
+            if not tags:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                wanted = set(tags)
+                stale = [k for k, (_, _, t) in self._entries.items() if t & wanted]
+                for k in stale:
+                    del self._entries[k]
+                removed = len(stale)
+            self._invalidations += removed
+            return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+# An in-memory structure (index, lookup table, ...) built by `loader` and rebuilt
+# in the background once it is older than `ttl`. Readers keep getting the previous
+# build while the next one loads; only the very first get() waits. A build is tied
+# to the data it was loaded from: once `version()` (e.g. the data version of the
+# tables behind it) has moved on, or after invalidate(), the old build is no longer
+# served and the next get() rebuilds and waits for it.
+
+class RefreshingValue:
+    def __init__(self, loader, ttl, name="refresh", version=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.name = name
+        self.version = version
+        self._value = None
+        self._built_at = 0.0
+        self._built_stamp = None
+        self._generation = 0  # bumped by invalidate()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._loads = 0
+        self._failures = 0
+        self._last_error = None
+
+    def _stamp(self):
+        with self._lock:
+            generation = self._generation
+        return generation, self.version() if self.version else None
+
+    def _load(self):
+        # Stamped before loading, so a build that a write or invalidate() overtook counts as stale
+        stamp = self._stamp()
+        started = time.monotonic()
+        try:
+            value = self.loader()
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                self._last_error = str(e)
+            raise
+        with self._lock:
+            self._value = value
+            self._built_at = started
+            self._built_stamp = stamp
+            self._loads += 1
+            self._last_error = None
+        return value
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                with self._load_lock:
+                    self._load()
+            except Exception as e:
+                print(f"Background refresh of {self.name} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name=f"{self.name}-refresh", daemon=True).start()
+
+    def _current(self, stamp):
+        # The build, if there is one and it was made from the data at `stamp`
+        with self._lock:
+            return self._value if self._built_stamp == stamp else None
+
+    def get(self):
+        value = self._current(self._stamp())
+        if value is None:
+            with self._load_lock:
+                value = self._current(self._stamp())
+                if value is None:
+                    value = self._load()
+        elif time.monotonic() - self._built_at > self.ttl:
+            self._refresh_in_background()
+        return value
+
+    def prefetch(self):
+        # Start building in the background; a get() arriving meanwhile waits for this build
+        self._refresh_in_background()
+
+    def invalidate(self):
+        # Stop serving the current build; the next get() rebuilds and waits for it
+        with self._lock:
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self._value is not None,
+                "age_seconds": round(time.monotonic() - self._built_at, 3) if self._value is not None else None,
+                "loads": self._loads,
+                "failures": self._failures,
+                "last_error": self._last_error,
+            }
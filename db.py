@@ -0,0 +1,443 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+from databricks import sql
+
+import metrics
+
+try:
+    import pyarrow as pa
+except ImportError:  # only needed for the columnar fetch path
+    pa = None
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def _timed_execute(cursor, query, params=None):
+    # cursor.execute, returning how long it took
+    started = time.perf_counter()
+    if params:
+        cursor.execute(query, params)
+    else:
+        cursor.execute(query)
+    return time.perf_counter() - started
+
+
+def execute(pool, query, params=None):
+    # Runs one statement on a pooled session and returns (columns, rows)
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            executed = _timed_execute(cursor, query, params)
+            started = time.perf_counter()
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = cursor.fetchall()
+            metrics.record_statement(query, executed, time.perf_counter() - started, len(rows))
+            return columns, rows
+
+
+# -------------------- BACKENDS --------------------
+# A backend is anything with connect() -> DB-API connection and
+# ping(connection) -> None (raises when the session is unusable). Swap in a
+# local stand-in to exercise the pool without a Databricks workspace.
+
+class DatabricksBackend:
+    # `credentials` is called on every new session and returns
+    # (host, http_path, access_token), so rotated tokens apply without a restart.
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def connect(self):
+        host, http_path, access_token = self.credentials()
+        return sql.connect(server_hostname=host, http_path=http_path, access_token=access_token)
+
+    def ping(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+
+
+# -------------------- POOL --------------------
+
+class _Pooled:
+    __slots__ = ("connection", "created_at", "last_used", "last_checked")
+
+    def __init__(self, connection):
+        now = time.monotonic()
+        self.connection = connection
+        self.created_at = now
+        self.last_used = now
+        self.last_checked = now
+
+
+class ConnectionPool:
+    def __init__(self, backend, max_size=8, acquire_timeout=30, max_idle_seconds=300,
+                 max_lifetime_seconds=3600, health_check_interval=60):
+        self.backend = backend
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # LIFO so the most recently used (warmest) session is reused first
+        self._total = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._created = 0
+        self._recycled = 0
+        self._acquired = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _expired(self, pooled, now):
+        return (now - pooled.last_used > self.max_idle_seconds
+                or now - pooled.created_at > self.max_lifetime_seconds)
+
+    def _close_quietly(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def _healthy(self, pooled):
+        try:
+            self.backend.ping(pooled.connection)
+        except Exception:
+            return False
+        pooled.last_checked = time.monotonic()
+        return True
+
+    def _open(self):
+        pooled = _Pooled(self.backend.connect())
+        with self._cond:
+            self._created += 1
+        return pooled
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        stale = []
+        pooled = None
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if self._expired(candidate, now):
+                        stale.append(candidate)
+                        self._total -= 1
+                        self._recycled += 1
+                        continue
+                    pooled = candidate
+                    break
+                if pooled is not None or self._total < self.max_size:
+                    if pooled is None:
+                        self._total += 1  # reserve the slot before connecting outside the lock
+                    self._in_use += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"Timed out after {timeout}s waiting for a warehouse connection")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait = time.monotonic() - start
+            self._acquired += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            if waited:
+                self._waits += 1
+
+        for s in stale:
+            self._close_quietly(s)
+
+        try:
+            if pooled is None:
+                pooled = self._open()
+            elif time.monotonic() - pooled.last_checked > self.health_check_interval and not self._healthy(pooled):
+                self._close_quietly(pooled)
+                with self._cond:
+                    self._recycled += 1
+                pooled = self._open()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return pooled
+
+    def release(self, pooled, discard=False):
+        now = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed or now - pooled.created_at > self.max_lifetime_seconds:
+                self._total -= 1
+                self._recycled += 1
+                keep = False
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+                keep = True
+            self._cond.notify()
+        if not keep:
+            self._close_quietly(pooled)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        started = time.perf_counter()
+        pooled = self.acquire(timeout)
+        metrics.record_phase("connect", time.perf_counter() - started)
+        discard = False
+        try:
+            yield pooled.connection
+        except Exception:
+            # Query errors usually leave the session intact; only drop it if it no longer answers.
+            discard = not self._healthy(pooled)
+            raise
+        finally:
+            # Also reached on GeneratorExit, when a generator holding the session
+            # (iter_batches) is closed before it was exhausted
+            self.release(pooled, discard=discard)
+
+    def prune(self):
+        # Close idle sessions past their idle/lifetime cap without waiting for the next acquire.
+        now = time.monotonic()
+        with self._cond:
+            stale = [p for p in self._idle if self._expired(p, now)]
+            self._idle = [p for p in self._idle if not self._expired(p, now)]
+            self._total -= len(stale)
+            self._recycled += len(stale)
+            self._cond.notify_all()
+        for s in stale:
+            self._close_quietly(s)
+        return len(stale)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for p in idle:
+            self._close_quietly(p)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "total": self._total,
+                "created": self._created,
+                "recycled": self._recycled,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+                "wait_seconds_avg": round(self._wait_total / self._acquired, 6) if self._acquired else 0.0,
+            }
+
+
+def execute_arrow(pool, query, params=None):
+    # Columnar fetch: returns a pyarrow.Table straight from the connector without
+    # building per-row Python objects. Backends without Arrow support fall back to
+    # transposing the row result.
+    if pa is None:
+        raise RuntimeError("pyarrow is required for columnar responses")
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            executed = _timed_execute(cursor, query, params)
+            started = time.perf_counter()
+            if hasattr(cursor, "fetchall_arrow"):
+                table = cursor.fetchall_arrow()
+            else:
+                columns = [desc[0] for desc in cursor.description]
+                rows = cursor.fetchall()
+                table = pa.table({name: list(values) for name, values in zip(columns, zip(*rows))} if rows
+                                 else {name: [] for name in columns})
+            metrics.record_statement(query, executed, time.perf_counter() - started, table.num_rows)
+            return table
+
+
+# Failures that say nothing about the rows themselves: the session, the network or
+# the warehouse is unavailable, so the same write may well succeed later. Matched by
+# class name (anywhere in the MRO) and message, so stand-in backends classify the same way.
+TRANSIENT_ERROR_TYPES = {
+    "RequestError", "MaxRetryDurationError", "SessionAlreadyClosedError", "CursorAlreadyClosedError",
+    "ConnectionError", "TimeoutError", "PoolTimeout",
+}
+TRANSIENT_ERROR_MARKERS = ("TEMPORARILY_UNAVAILABLE", "SERVICE_UNAVAILABLE", "Service Unavailable", "Too Many Requests")
+
+
+def is_transient(error):
+    if any(cls.__name__ in TRANSIENT_ERROR_TYPES for cls in type(error).__mro__):
+        return True
+    message = str(error)
+    return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+
+class TransientWriteError(Exception):
+    # insert_rows stopped on a retryable failure. `written` lists the row numbers
+    # that landed before it and `errors` the rows already rejected ({row_number: error}),
+    # so a caller retrying the write can skip both.
+    def __init__(self, cause, written, errors):
+        super().__init__(f"{cause} ({len(written)} rows written before the failure)")
+        self.written = written
+        self.errors = errors
+
+
+def insert_rows(pool, table, columns, rows, batch_size=50):
+    # Multi-row INSERTs of `batch_size` rows on one session. `rows` is a list of
+    # (row_number, values). A failing batch is retried row by row so one bad row
+    # doesn't sink the others; returns {row_number: error} for the rows that failed.
+    # A transient failure (see is_transient) is not a row error: it stops the
+    # write with TransientWriteError.
+    errors, written = {}, []
+    placeholders = "(" + ", ".join("?" for _ in columns) + ")"
+    head = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                query = head + ", ".join(placeholders for _ in batch)
+                try:
+                    executed = _timed_execute(cursor, query, [value for _, values in batch for value in values])
+                    metrics.record_statement(query, executed, rows=len(batch))
+                    written.extend(row_number for row_number, _ in batch)
+                    continue
+                except Exception as e:
+                    if is_transient(e):
+                        raise TransientWriteError(e, written, errors) from e
+                for row_number, values in batch:
+                    try:
+                        executed = _timed_execute(cursor, head + placeholders, list(values))
+                        metrics.record_statement(head + placeholders, executed, rows=1)
+                        written.append(row_number)
+                    except Exception as e:
+                        if is_transient(e):
+                            raise TransientWriteError(e, written, errors) from e
+                        errors[row_number] = str(e)
+    return errors
+
+
+def iter_batches(pool, query, params=None, batch_size=1000):
+    # Yields the column names once the statement has run, then lists of rows
+    # pulled with fetchmany, so only one batch is held in memory at a time.
+    with pool.connection() as connection:
+        with connection.cursor() as cursor:
+            executed = _timed_execute(cursor, query, params)
+            fetched, rows = 0.0, 0
+            try:
+                yield [desc[0] for desc in cursor.description] if cursor.description else []
+                while True:
+                    started = time.perf_counter()
+                    batch = cursor.fetchmany(batch_size)
+                    fetched += time.perf_counter() - started
+                    if not batch:
+                        break
+                    rows += len(batch)
+                    yield batch
+            finally:
+                metrics.record_statement(query, executed, fetched, rows)
+
+
+def fan_out(executor, tasks, timeout, timeouts=None):
+    # Runs independent sub-queries concurrently; `tasks` maps name -> callable.
+    # Returns (results, errors) so a composite endpoint can report partial failures.
+    # A timed-out sub-query is abandoned, not interrupted: its session returns to
+    # the pool once the warehouse finishes.
+    timeouts = timeouts or {}
+    start = time.monotonic()
+    # Each task runs in a copy of the caller's context so its timings join the request's trace
+    futures = {name: executor.submit(contextvars.copy_context().run, fn) for name, fn in tasks.items()}
+    results, errors = {}, {}
+    for name, future in futures.items():
+        limit = timeouts.get(name, timeout)
+        try:
+            results[name] = future.result(timeout=max(0.0, start + limit - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            errors[name] = f"Timed out after {limit}s"
+        except Exception as e:
+            errors[name] = str(e)
+    return results, errors
+
+
+# -------------------- SINGLE-FLIGHT --------------------
+# Concurrent callers asking for the same key wait on the first caller's
+# execution and share its result (or its exception) instead of running again.
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._executed = 0
+        self._shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._executed += 1
+            else:
+                self._shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def forget(self):
+        # Callers arriving from now on start a fresh execution instead of joining
+        # one already running (e.g. after a write); current waiters are unaffected
+        with self._lock:
+            self._flights.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "executed": self._executed,
+                "shared": self._shared,
+            }
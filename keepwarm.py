@@ -0,0 +1,180 @@
+import contextlib
+import datetime
+import threading
+import time
+
+from zoneinfo import ZoneInfo
+
+from db import PoolTimeout
+
+
+# Keep-warm. During business hours a background thread pings the warehouse on a
+# schedule through pooled sessions, so the serverless warehouse doesn't auto-stop
+# between bursts and the pool keeps `min_sessions` sessions open and recently
+# used. Every ping's outcome is kept for the readiness probe, which can then
+# report warehouse state without touching the warehouse itself.
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def parse_window(spec):
+    # "mon-fri 06:00-19:00" -> (weekday numbers, start, end); "" or "always" -> None
+    spec = (spec or "").strip().lower()
+    if spec in ("", "always"):
+        return None
+    days_part, _, hours_part = spec.partition(" ")
+    if ":" in days_part:  # hours only, every day
+        days_part, hours_part = "mon-sun", days_part
+
+    days = set()
+    for chunk in days_part.split(","):
+        first, _, last = chunk.partition("-")
+        start, end = DAYS.index(first), DAYS.index(last or first)
+        days.update(range(start, end + 1) if start <= end else [*range(start, 7), *range(0, end + 1)])
+
+    opens, _, closes = hours_part.strip().partition("-")
+    return days, datetime.time.fromisoformat(opens), datetime.time.fromisoformat(closes)
+
+
+class KeepWarm:
+    def __init__(self, pool, interval=240.0, window=None, timezone=None, min_sessions=2,
+                 query="SELECT 1", acquire_timeout=5.0, failure_threshold=3, retry_interval=30.0):
+        self.pool = pool
+        self.interval = interval
+        self.window = parse_window(window)
+        self.timezone = ZoneInfo(timezone) if timezone else None  # required with a window; see start()
+        self.min_sessions = min_sessions
+        self.query = query
+        self.acquire_timeout = acquire_timeout
+        self.failure_threshold = failure_threshold  # consecutive failed pings before "unreachable"
+        self.retry_interval = retry_interval  # next ping after a failure comes sooner
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._last_ping_at = None  # wall clock, for reporting
+        self._last_ok_at = None  # monotonic
+        self._last_latency = None
+        self._last_error = None
+        self._failures = 0
+        self._busy = False
+        self._pings = 0
+        self._sessions = 0
+
+    def start(self):
+        # Server local time is usually UTC, which would put business hours in the
+        # wrong place, so a window is only accepted with an explicit timezone
+        if self.window is not None and self.timezone is None:
+            raise ValueError("A keep-warm window needs a timezone (e.g. America/Chicago)")
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="keep-warm", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def in_window(self, now=None):
+        if self.window is None:
+            return True
+        now = now or datetime.datetime.now(self.timezone)
+        days, opens, closes = self.window
+        if now.weekday() not in days:
+            return False
+        current = now.time()
+        return opens <= current < closes if opens <= closes else (current >= opens or current < closes)
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self.interval
+            if self.in_window():
+                try:
+                    self.ping(self.min_sessions)
+                except Exception as e:
+                    print(f"Keep-warm ping failed: {e}")
+                    wait = min(self.interval, self.retry_interval)
+            self._stop.wait(wait)
+
+    def _ping_session(self, connection):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(self.query)
+            cursor.fetchall()
+        return time.perf_counter() - started
+
+    def ping(self, sessions=1):
+        # Runs the query on up to `sessions` pooled sessions at once (opening them
+        # if the pool has fewer) and records the outcome; returns the latency.
+        # Only the first session waits for a busy pool: sessions in use are warm anyway.
+        # A pool with every session busy is serving queries, so it counts as a warm
+        # warehouse rather than a failed ping (and returns None).
+        try:
+            with contextlib.ExitStack() as stack:
+                try:
+                    connections = [stack.enter_context(self.pool.connection(self.acquire_timeout))]
+                except PoolTimeout:
+                    with self._lock:
+                        self._last_ping_at = time.time()
+                        self._last_ok_at = time.monotonic()
+                        self._busy = True
+                        self._pings += 1
+                    return None
+                for _ in range(sessions - 1):
+                    try:
+                        connections.append(stack.enter_context(self.pool.connection(timeout=0)))
+                    except PoolTimeout:
+                        break
+                latency = max(self._ping_session(connection) for connection in connections)
+        except Exception as e:
+            with self._lock:
+                self._last_ping_at = time.time()
+                self._last_error = str(e)
+                self._failures += 1
+                self._pings += 1
+            raise
+
+        with self._lock:
+            self._last_ping_at = time.time()
+            self._last_ok_at = time.monotonic()
+            self._last_latency = latency
+            self._last_error = None
+            self._failures = 0
+            self._busy = False
+            self._pings += 1
+            self._sessions = len(connections)
+        return latency
+
+    def fresh(self):
+        # Whether the last successful ping is recent enough to vouch for the warehouse
+        with self._lock:
+            return self._last_ok_at is not None and time.monotonic() - self._last_ok_at <= 2 * self.interval
+
+    def status(self):
+        fresh = self.fresh()
+        with self._lock:
+            if self._failures >= self.failure_threshold:
+                state = "unreachable"
+            elif self._failures:
+                state = "degraded"  # recent failures, not yet enough to call it down
+            elif self._last_ok_at is None:
+                state = "unknown"
+            elif fresh:
+                state = "busy" if self._busy else "warm"
+            else:
+                state = "idle"  # outside the window the warehouse may have auto-stopped
+            return {
+                "state": state,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "in_window": self.in_window(),
+                "interval_seconds": self.interval,
+                "last_ping_at": (datetime.datetime.fromtimestamp(self._last_ping_at, datetime.timezone.utc).isoformat()
+                                 if self._last_ping_at else None),
+                "last_latency_ms": round(self._last_latency * 1000, 1) if self._last_latency is not None else None,
+                "last_error": self._last_error,
+                "consecutive_failures": self._failures,
+                "pings": self._pings,
+                "sessions_warmed": self._sessions,
+            }
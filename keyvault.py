@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.identity import ClientSecretCredential
+from azure.keyvault.secrets import SecretClient
+
+
+# Key Vault secrets, fetched lazily and in parallel, cached in memory for `ttl`
+# seconds. An expired value keeps being served while a background thread
+# refreshes it, so rotated secrets are picked up without blocking requests.
+# Any secret the vault can't provide falls back to the matching environment
+# variable (DATABRICKS-HOST -> DATABRICKS_HOST), i.e. the .env values.
+
+class SecretProvider:
+    def __init__(self, names, vault_url=None, tenant_id=None, client_id=None, client_secret=None, ttl=3600):
+        self.names = list(names)
+        self.vault_url = vault_url
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.ttl = ttl
+
+        self._client = None
+        self._values = {}  # name -> (value, fetched_at)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+
+    @staticmethod
+    def env_name(name):
+        return name.replace("-", "_")
+
+    def _secret_client(self):
+        if self._client is None:
+            credential = ClientSecretCredential(
+                tenant_id=self.tenant_id,
+                client_id=self.client_id,
+                client_secret=self.client_secret
+            )
+            self._client = SecretClient(vault_url=self.vault_url, credential=credential)
+        return self._client
+
+    def _fetch_one(self, name):
+        if self.vault_url:
+            try:
+                return self._secret_client().get_secret(name).value
+            except Exception as e:
+                print(f"Key Vault lookup for {name} failed, falling back to environment: {e}")
+        return os.getenv(self.env_name(name))
+
+    def _fetch(self, names):
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            values = dict(zip(names, executor.map(self._fetch_one, names)))
+        now = time.monotonic()
+        with self._lock:
+            for name, value in values.items():
+                if value is not None:
+                    self._values[name] = (value, now)
+                elif name in self._values:
+                    # Keep serving the last good value rather than dropping it
+                    self._values[name] = (self._values[name][0], now)
+        return values
+
+    def refresh(self):
+        # Fetches every secret now; a get() that finds nothing cached waits for it
+        with self._load_lock:
+            self._fetch(self.names)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        # Taken before the thread starts (and skipped if a fetch is already running),
+        # so a get() that finds nothing cached waits for this fetch instead of
+        # starting a second one
+        if not self._load_lock.acquire(blocking=False):
+            with self._lock:
+                self._refreshing = False
+            return
+
+        def run():
+            try:
+                self._fetch(self.names)
+            finally:
+                self._load_lock.release()
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="secret-refresh", daemon=True).start()
+
+    def prefetch(self):
+        # Warm the cache without holding up startup; the first get() only waits if it isn't done yet
+        self._refresh_in_background()
+
+    def get(self, name):
+        with self._lock:
+            cached = self._values.get(name)
+        if cached is None:
+            with self._load_lock:
+                with self._lock:
+                    cached = self._values.get(name)
+                if cached is None:
+                    self._fetch(self.names if name in self.names else [name])
+                    with self._lock:
+                        cached = self._values.get(name)
+            if cached is None:
+                raise KeyError(f"Secret {name} is not available from Key Vault or environment")
+        elif time.monotonic() - cached[1] > self.ttl:
+            self._refresh_in_background()
+        return cached[0]
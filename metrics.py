@@ -0,0 +1,169 @@
+import contextvars
+import hashlib
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Request instrumentation. Each request gets a trace (held in a context variable,
+# so helpers deep in db.py can find it) that adds up time per phase - connect,
+# execute, fetch, serialize - for its Server-Timing header. Every observation also
+# lands in process-wide histograms rendered in the Prometheus text format.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+slow_query_seconds = 2.0
+last_statement = None  # (wall clock, seconds) of the most recent statement, for the readiness probe
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {round(values[-2], 6)}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram("gage_request_seconds", "Request latency by route", ("route", "method", "status"))
+PHASE_SECONDS = Histogram("gage_phase_seconds", "Time per request phase", ("route", "phase"))
+STATEMENT_SECONDS = Histogram("gage_statement_seconds", "Statement execute time by SQL fingerprint", ("route", "fingerprint"))
+STATEMENT_ROWS = Histogram("gage_statement_rows", "Rows returned or written per statement", ("route", "fingerprint"), ROW_BUCKETS)
+HISTOGRAMS = [REQUEST_SECONDS, PHASE_SECONDS, STATEMENT_SECONDS, STATEMENT_ROWS]
+
+
+# -------------------- SQL FINGERPRINTS --------------------
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUES = re.compile(r"(\([?,\s]*\))(?:\s*,\s*\([?,\s]*\))+")  # multi-row VALUES lists
+
+
+def normalize_sql(query):
+    # Literals become ?, whitespace collapses, and a multi-row VALUES list counts as one row
+    query = _NUMBER.sub("?", _STRING.sub("?", query))
+    return _VALUES.sub(r"\1, ...", " ".join(query.split()))
+
+
+def fingerprint(query):
+    return hashlib.sha1(normalize_sql(query).encode()).hexdigest()[:12]
+
+
+# -------------------- TRACES --------------------
+
+class RequestTrace:
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases = {}  # phase -> seconds
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, rows=0):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.rows += rows
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        with self._lock:
+            parts = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items()]
+            rows = self.rows
+        parts.append(f'rows;desc="{rows}"')
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current = contextvars.ContextVar("gage_request_trace", default=None)
+
+
+def start_trace(route):
+    trace = RequestTrace(route)
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def _route():
+    trace = _current.get()
+    return trace.route if trace else "-"
+
+
+def record_phase(phase, seconds, rows=0):
+    trace = _current.get()
+    if trace is not None:
+        trace.add(phase, seconds, rows)
+    PHASE_SECONDS.observe(seconds, trace.route if trace else "-", phase)
+
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def record_statement(query, execute_seconds, fetch_seconds=0.0, rows=0):
+    # One executed statement: phase totals, per-fingerprint histograms and the slow-query log
+    global last_statement
+    route = _route()
+    key = fingerprint(query)
+    last_statement = (time.time(), execute_seconds + fetch_seconds)
+    record_phase("execute", execute_seconds)
+    if fetch_seconds or rows:
+        record_phase("fetch", fetch_seconds, rows)
+    STATEMENT_SECONDS.observe(execute_seconds, route, key)
+    STATEMENT_ROWS.observe(rows, route, key)
+
+    if execute_seconds + fetch_seconds >= slow_query_seconds:
+        print(f"Slow query [{key}] on {route}: execute {execute_seconds:.3f}s, fetch {fetch_seconds:.3f}s, "
+              f"{rows} rows: {normalize_sql(query)[:500]}")
+
+
+def render(gauges=None):
+    # Prometheus text exposition; `gauges` maps metric name -> (help, value)
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,66 @@
+import base64
+import decimal
+import json
+
+
+# Keyset (cursor) pagination helpers. A cursor is the sort-key values of the last
+# row on a page, opaque to the client; the next page is everything strictly after
+# it in sort order, so the warehouse never has to skip over earlier rows.
+
+MAX_LIMIT = 1000
+
+
+def parse_limit(value, default=100):
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def parse_sort(value, allowed, default):
+    # "bushels" sorts ascending, "-bushels" descending
+    value = value or default
+    descending = value.startswith("-")
+    field = value.lstrip("-")
+    if field not in allowed:
+        raise ValueError(f"sort must be one of: {', '.join(sorted(allowed))} (prefix with - for descending)")
+    return field, descending
+
+
+def _plain(value):
+    return float(value) if isinstance(value, decimal.Decimal) else value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_plain(v) for v in values], default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, size):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_predicate(keys, values, descending=False):
+    # (k0 > ?) OR (k0 = ? AND k1 > ?) OR ... - spelled out rather than as a row
+    # comparison so it works on any SQL dialect. Keys must be non-null expressions.
+    op = "<" if descending else ">"
+    clauses, params = [], []
+    for i, key in enumerate(keys):
+        parts = [f"{k} = ?" for k in keys[:i]] + [f"{key} {op} ?"]
+        clauses.append("(" + " AND ".join(parts) + ")")
+        params.extend(values[:i + 1])
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def order_by(keys, descending=False):
+    direction = "DESC" if descending else "ASC"
+    return ", ".join(f"{k} {direction}" for k in keys)
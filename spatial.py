@@ -0,0 +1,170 @@
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # from_table() needs it; from_rows() does not
+    pa = None
+
+
+# In-memory producer locations for the sourcing map. Points are bucketed into a
+# fixed grid of CELL_DEG x CELL_DEG cells so viewport queries only touch the
+# cells that overlap the bounding box; aggregation runs vectorised over numpy
+# arrays rather than per-row Python objects.
+
+CELL_DEG = 1.0
+CELLS_PER_TILE = 8  # cluster grid: roughly 32px cells on a 256px map tile
+MAX_ZOOM = 22
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+MAX_DISTANCE_KM = 20016.0  # half the earth's circumference
+
+
+def haversine_km(lat, lon, lats, lons):
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class ProducerIndex:
+    def __init__(self, names, types, lat, lon, ci, bushels):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+
+        self.names = np.asarray(names, dtype=object)[valid]
+        self.types = np.asarray(types, dtype=object)[valid]
+        self.lat = lat[valid]
+        self.lon = lon[valid]
+        self.ci = np.asarray(ci, dtype=float)[valid]
+        self.bushels = np.nan_to_num(np.asarray(bushels, dtype=float)[valid])
+
+        # cell -> indices of the points in it
+        cx = np.floor(self.lon / CELL_DEG).astype(np.int64)
+        cy = np.floor(self.lat / CELL_DEG).astype(np.int64)
+        order = np.lexsort((cy, cx))
+        keys = np.stack([cx[order], cy[order]], axis=1)
+        self._cells = {}
+        if len(order):
+            starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)])
+            for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+                self._cells[(int(keys[start, 0]), int(keys[start, 1]))] = order[start:end]
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows: (name, type, latitude, longitude, ci_score, bushels)
+        columns = list(zip(*rows)) if rows else [[]] * 6
+        to_float = lambda values: [np.nan if v is None else float(v) for v in values]
+        return cls(columns[0], columns[1], to_float(columns[2]), to_float(columns[3]),
+                   to_float(columns[4]), to_float(columns[5]))
+
+    @classmethod
+    def from_table(cls, table):
+        def floats(i):
+            return table.column(i).cast(pa.float64()).to_numpy(zero_copy_only=False)
+
+        return cls(table.column(0).to_pylist(), table.column(1).to_pylist(),
+                   floats(2), floats(3), floats(4), floats(5))
+
+    def within(self, min_lon, min_lat, max_lon, max_lat):
+        # Indices of points inside the bounding box
+        x0, x1 = int(np.floor(min_lon / CELL_DEG)), int(np.floor(max_lon / CELL_DEG))
+        y0, y1 = int(np.floor(min_lat / CELL_DEG)), int(np.floor(max_lat / CELL_DEG))
+        if (x1 - x0 + 1) * (y1 - y0 + 1) >= len(self._cells):
+            candidates = np.arange(len(self.lat))
+        else:
+            hits = [self._cells[(x, y)] for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in self._cells]
+            if not hits:
+                return np.empty(0, dtype=np.int64)
+            candidates = np.concatenate(hits)
+
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        return candidates[inside]
+
+    def clusters(self, min_lon, min_lat, max_lon, max_lat, zoom, producer_type=None):
+        idx = self.within(min_lon, min_lat, max_lon, max_lat)
+        if producer_type is not None:
+            idx = idx[self.types[idx] == producer_type]
+
+        size = 360.0 / (2 ** zoom) / CELLS_PER_TILE
+        if not len(idx):
+            return size, []
+
+        lat, lon = self.lat[idx], self.lon[idx]
+        ci, bushels = self.ci[idx], self.bushels[idx]
+        gx = np.floor(lon / size).astype(np.int64)
+        gy = np.floor(lat / size).astype(np.int64)
+        _, first, inverse = np.unique(np.stack([gx, gy], axis=1), axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+
+        count = np.bincount(inverse)
+        scored = ~np.isnan(ci)
+        ci_count = np.bincount(inverse, weights=scored)
+        ci_sum = np.bincount(inverse, weights=np.where(scored, ci, 0.0))
+        mean_lat = np.bincount(inverse, weights=lat) / count
+        mean_lon = np.bincount(inverse, weights=lon) / count
+        total_bushels = np.bincount(inverse, weights=bushels)
+
+        result = []
+        for i in range(len(count)):
+            cluster = {
+                "latitude": round(float(mean_lat[i]), 6),
+                "longitude": round(float(mean_lon[i]), 6),
+                "count": int(count[i]),
+                "bushels": round(float(total_bushels[i]), 2),
+                "ci_score": round(float(ci_sum[i] / ci_count[i]), 2) if ci_count[i] else None,
+            }
+            if count[i] == 1:
+                only = idx[first[i]]
+                cluster["name"] = self.names[only]
+                cluster["type"] = self.types[only]
+            result.append(cluster)
+        return size, result
+
+    def radius(self, lat, lon, km, producer_type=None):
+        # (indices, distances) of points within `km` of (lat, lon): the grid narrows the
+        # search to the enclosing box, haversine makes it exact
+        dlat = km / KM_PER_DEG_LAT
+        dlon = km / (KM_PER_DEG_LAT * max(np.cos(np.radians(lat)), 1e-6))
+        if dlon >= 180 or abs(lat) + dlat >= 90:
+            idx = np.arange(len(self.lat))
+        else:
+            idx = self.within(lon - dlon, max(lat - dlat, -90.0), lon + dlon, min(lat + dlat, 90.0))
+        if producer_type is not None:
+            idx = idx[self.types[idx] == producer_type]
+        dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        inside = dist <= km
+        return idx[inside], dist[inside]
+
+    def nearest(self, lat, lon, k, max_km=None, producer_type=None):
+        # Widen the search radius until it holds k points; the k closest of those are
+        # then the true k nearest, since the circle contains everything that close.
+        km = min(50.0, max_km) if max_km else 50.0
+        while True:
+            idx, dist = self.radius(lat, lon, km, producer_type)
+            limit = max_km or MAX_DISTANCE_KM
+            if len(idx) >= k or km >= limit:
+                break
+            km = min(km * 2, limit)
+        order = np.argsort(dist, kind="stable")[:k]
+        return idx[order], dist[order]
+
+    def ranked_by_ci(self, idx, dist, limit=None):
+        # Lowest CI first (unscored last), nearest first among equal scores
+        ci = self.ci[idx]
+        order = np.lexsort((dist, np.where(np.isnan(ci), np.inf, ci)))
+        if limit is not None:
+            order = order[:limit]
+        return [{
+            "name": self.names[i],
+            "type": self.types[i],
+            "latitude": float(self.lat[i]),
+            "longitude": float(self.lon[i]),
+            "ci_score": None if np.isnan(self.ci[i]) else float(self.ci[i]),
+            "bushels": round(float(self.bushels[i]), 2),
+            "distance_km": round(float(d), 2),
+        } for i, d in zip(idx[order], dist[order])]
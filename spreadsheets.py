@@ -0,0 +1,126 @@
+import csv
+import io
+
+
+# Spreadsheet helpers for bulk imports and exports. Sheets are read with openpyxl
+# in read-only mode (rows are streamed, not the whole workbook model), then
+# validated column-at-a-time with pandas instead of row by row. Exports consume
+# row batches as they are fetched, so memory stays flat whatever the size.
+# pandas and openpyxl are imported by the functions that use them, so they only
+# slow down the first import or export rather than every worker start.
+
+MAX_REPORTED_ERRORS = 500
+
+
+def normalise_header(value):
+    return str(value or "").strip().lower().replace(" ", "").replace("_", "")
+
+
+def read_sheet(stream, filename):
+    # Returns a DataFrame of raw cell values, one column per header, all as objects
+    import pandas as pd
+
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            data = [(n, row) for n, row in enumerate(rows, start=2) if any(cell not in (None, "") for cell in row)]
+        finally:
+            workbook.close()
+    elif filename.lower().endswith(".csv"):
+        reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        header = next(reader, None) or []
+        data = [(n, row) for n, row in enumerate(reader, start=2) if any(cell.strip() for cell in row)]
+    else:
+        raise ValueError("Upload an .xlsx or .csv file")
+
+    columns = [normalise_header(h) for h in header]
+    width = len(columns)
+    # Indexed by spreadsheet row number (1-based, header on row 1) for diagnostics;
+    # numbered before blank rows are dropped, so the numbers match the sheet
+    frame = pd.DataFrame([list(row[:width]) + [None] * (width - len(row)) for _, row in data],
+                         index=[n for n, _ in data], columns=columns, dtype=object)
+    return frame.replace("", None)
+
+
+def validate(frame, required, numeric=(), dates=(), date_ranges=(), defaults=None):
+    # Returns (rows, errors): rows are (sheet_row, values in `required` order) for
+    # every row that passed, errors are {row, column, error, value} diagnostics.
+    import pandas as pd
+
+    defaults = defaults or {}
+    missing = [c for c in required if normalise_header(c) not in frame.columns and c not in defaults]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+    values, timestamps, problems = {}, {}, []
+    for column in required:
+        key = normalise_header(column)
+        raw = frame[key] if key in frame.columns else pd.Series(None, index=frame.index, dtype=object)
+        if column in defaults:
+            raw = raw.where(raw.notna(), defaults[column])
+        blank = raw.isna()
+
+        if column in numeric:
+            parsed = pd.to_numeric(raw, errors="coerce")
+            invalid = parsed.isna() & ~blank
+            parsed = parsed.astype(object).where(parsed.notna(), None)
+            message = "not a number"
+        elif column in dates:
+            # "mixed": each cell is parsed on its own rather than in the format inferred from the first
+            parsed = timestamps[column] = pd.to_datetime(raw, errors="coerce", format="mixed")
+            invalid = parsed.isna() & ~blank
+            parsed = pd.Series([d.date() if pd.notna(d) else None for d in parsed], index=frame.index, dtype=object)
+            message = "not a valid date"
+        else:
+            parsed = raw.map(lambda v: None if v is None else str(v).strip())
+            invalid = pd.Series(False, index=frame.index)
+            message = None
+
+        for row in blank[blank].index:
+            problems.append({"row": int(row), "column": column, "error": "required", "value": None})
+        if message:
+            for row in invalid[invalid].index:
+                problems.append({"row": int(row), "column": column, "error": message, "value": str(raw[row])})
+        values[column] = parsed
+
+    for start, end in date_ranges:
+        reversed_range = timestamps[start] > timestamps[end]  # NaT compares False
+        for row in reversed_range[reversed_range].index:
+            problems.append({"row": int(row), "column": end, "error": f"must not be before {start}", "value": str(values[end][row])})
+
+    bad_rows = {p["row"] for p in problems}
+    rows = [
+        (int(row), tuple(values[c][row] for c in required))
+        for row in frame.index if row not in bad_rows
+    ]
+    problems.sort(key=lambda p: (p["row"], required.index(p["column"])))
+    return rows, problems
+
+
+def csv_chunks(header, batches):
+    # Yields CSV text one fetched batch at a time
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+def write_xlsx(target, title, header, batches):
+    # openpyxl's write-only mode spools rows to disk instead of building the sheet in memory
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    sheet.append(list(header))
+    for batch in batches:
+        for row in batch:
+            sheet.append(list(row))
+    workbook.save(target)
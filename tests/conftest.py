@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The benchmark's SQLite stand-in for databricks.sql, ahead of the real connector
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+sys.path.insert(0, os.path.join(ROOT, "bench", "stubs"))
+
+
+# Warehouse stand-in for pool-level tests (import it from conftest). Each session
+# is an in-memory SQLite database holding t(n) = 0..99, where n may not be
+# negative, so a negative value is a data error the way a constraint violation is.
+
+class StandInCursor:
+    # sqlite3 cursors aren't context managers; Databricks cursors are
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.db.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, params=None):
+        self.connection.backend.execute(self._cursor, query, list(params or ()))
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1000):
+        return self._cursor.fetchmany(size)
+
+
+class StandInConnection:
+    def __init__(self, backend):
+        self.backend = backend
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.execute("CREATE TABLE t (n INTEGER CHECK (n >= 0))")
+        self.db.executemany("INSERT INTO t VALUES (?)", [(n,) for n in range(100)])
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def close(self):
+        self.db.close()
+
+
+class StandInBackend:
+    def __init__(self):
+        self.outage = None  # while set, every statement fails with this message
+
+    def connect(self):
+        return StandInConnection(self)
+
+    def ping(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    def execute(self, cursor, query, params):
+        # Every statement goes through here; override to inject failures
+        if self.outage:
+            raise RuntimeError(self.outage)
+        cursor.execute(query, params)
+
+
+@pytest.fixture(scope="session")
+def gage(tmp_path_factory):
+    # The app module, wired to a seeded stand-in warehouse with stubbed secrets
+    data_dir = str(tmp_path_factory.mktemp("warehouse"))
+    os.environ.update({
+        "BENCH_DATA_DIR": data_dir,
+        "KEY_VAULT_URL": "",
+        "DATABRICKS_HOST": "test",
+        "DATABRICKS_HTTP_PATH": "test",
+        "DATABRICKS_TOKEN": "test",
+        "JWT_SECRET": "test-secret",
+        "WRITE_QUEUE_PATH": os.path.join(data_dir, "write_queue.db"),
+        "DATA_VERSIONS_PATH": os.path.join(data_dir, "data_versions.db"),
+    })
+    import app
+    import seed
+    seed.seed(data_dir, 1, app.CUSTOMER_FIELDS, app.PLANTINFO_FIELDS)
+    return app
+
+
+@pytest.fixture
+def client(gage):
+    return gage.app.test_client()
+
+
+@pytest.fixture
+def warehouse(gage):
+    # Runs a statement on the stand-in warehouse behind the app's back, like a batch load
+    def execute(statement, params=()):
+        with gage.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(statement, params)
+    return execute
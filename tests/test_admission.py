@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from admission import Lane, Overloaded
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def queue_up(lane, name, admitted):
+    # Starts a request that records its name once admitted; returns after it is queued
+    waiting = lane.stats()["waiting"]
+    thread = threading.Thread(target=lambda: (lane.acquire(), admitted.append(name)))
+    thread.start()
+    wait_until(lambda: lane.stats()["waiting"] == waiting + 1)
+    return thread
+
+
+def test_free_slot_is_taken_without_waiting():
+    lane = Lane("read", limit=2, queue_size=0, max_wait=1)
+    assert lane.acquire() == 0.0
+    assert lane.acquire() == 0.0
+    stats = lane.stats()
+    assert (stats["active"], stats["admitted"], stats["queued"]) == (2, 2, 0)
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    lane = Lane("read", limit=1, queue_size=3, max_wait=5)
+    lane.acquire()
+    admitted = []
+    threads = [queue_up(lane, name, admitted) for name in ("first", "second", "third")]
+
+    for expected in range(1, 4):
+        lane.release(0.01)
+        wait_until(lambda: len(admitted) == expected)
+    for thread in threads:
+        thread.join()
+    assert admitted == ["first", "second", "third"]
+    stats = lane.stats()
+    assert (stats["active"], stats["waiting"], stats["queued"], stats["admitted"]) == (1, 0, 3, 4)
+
+
+def test_full_queue_rejects_immediately():
+    lane = Lane("export", limit=1, queue_size=1, max_wait=5)
+    lane.acquire()
+    admitted = []
+    waiter = queue_up(lane, "waiter", admitted)
+    with pytest.raises(Overloaded, match="queue is full") as shed:
+        lane.acquire()
+    assert shed.value.lane == "export" and shed.value.retry_after >= 1
+    assert lane.stats()["rejected"] == 1
+    lane.release(0.01)
+    waiter.join()
+    assert admitted == ["waiter"]
+
+
+def test_waiter_past_its_deadline_is_shed():
+    lane = Lane("write", limit=1, queue_size=4, max_wait=0.05)
+    lane.acquire()
+    with pytest.raises(Overloaded, match="wait exceeded"):
+        lane.acquire()
+    stats = lane.stats()
+    assert (stats["timed_out"], stats["waiting"], stats["active"]) == (1, 0, 1)
+    lane.release(0.01)
+    assert lane.acquire() == 0.0  # the timed-out waiter didn't leave a slot taken
+
+
+def test_release_hands_the_slot_on_and_tracks_hold_time():
+    lane = Lane("read", limit=1, queue_size=1, max_wait=5, max_retry_after=30)
+    lane.acquire()
+    lane.release(2.0)
+    assert lane.stats()["avg_hold_ms"] == 2000.0
+    assert lane.retry_after() == 2
+    assert lane.acquire() == 0.0
+    lane.release(4.0)
+    assert lane.stats()["avg_hold_ms"] == 2400.0
+    assert lane.stats()["active"] == 0
@@ -0,0 +1,49 @@
+import datetime
+
+import jwt
+
+from versions import DataVersions
+
+
+def test_business_rules_listing_follows_sourcing_invalidation(client, warehouse):
+    before = client.get("/setting/business-rules")
+    assert before.status_code == 200
+    assert {"Name": "zzz Producer"} not in before.get_json()
+
+    warehouse("INSERT INTO gold.producer (NameID, ERPNameID, Name, Type) VALUES (990001, 990001, 'zzz Producer', 'G')")
+    warehouse("INSERT INTO gold.ciscore (nameid) VALUES (990001)")
+    client.post("/cache/invalidate", json={"tags": ["sourcing"]})
+
+    after = client.get("/setting/business-rules", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert {"Name": "zzz Producer"} in after.get_json()
+    assert client.get("/setting/business-rules", headers={"If-None-Match": after.headers["ETag"]}).status_code == 304
+    assert client.get("/setting/business-rules/search?q=zzz").get_json() == [{"Name": "zzz Producer"}]
+
+
+def test_analytics_aggregates_follow_dashboard_invalidation(client, warehouse, gage, monkeypatch):
+    monkeypatch.setattr(gage, "ANALYTICS_ENABLED", True)
+
+    def other_percentages():
+        response = client.get("/dashboard/plants-ci-score-level")
+        return response, {row["plant_name"]: row["other_percentage"] for row in response.get_json()}
+
+    before, percentages = other_percentages()
+    warehouse("INSERT INTO gold.contractdata VALUES (990001, 1, 1, 'X', 10000000, 0)")
+    DataVersions(gage.data_versions.path).bump("dashboard")  # invalidated by another worker process
+
+    after, updated = other_percentages()
+    assert after.headers["ETag"] != before.headers["ETag"]
+    changed = [plant for plant in percentages if updated[plant] != percentages[plant]]
+    assert len(changed) == 1 and updated[changed[0]] > percentages[changed[0]]
+
+
+def test_stale_token_leaves_reads_unscoped(client, gage):
+    expired = jwt.encode({"email": "plant1@example.com", "plantid": 1, "exp": datetime.datetime.utcnow() - datetime.timedelta(minutes=1)},
+                         gage.jwt_secret(), algorithm="HS256")
+    for token in (expired, "not-a-token"):
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/sourcing/sources", headers=headers)
+        assert response.status_code == 200
+        assert response.get_json() == client.get("/sourcing/sources").get_json()
+        assert client.get("/api/protected", headers=headers).status_code == 401
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from cache import RefreshingValue
+
+
+def test_version_change_rebuilds_before_the_next_read():
+    data, version = ["a"], [1]
+    value = RefreshingValue(lambda: list(data), ttl=600, version=lambda: version[0])
+    assert value.get() == ["a"]
+    data.append("b")
+    assert value.get() == ["a"]  # same version: the build is still current
+    version[0] += 1
+    assert value.get() == ["a", "b"]
+
+
+def test_invalidate_rebuilds_before_the_next_read():
+    data = ["a"]
+    value = RefreshingValue(lambda: list(data), ttl=600)
+    value.get()
+    data.append("b")
+    value.invalidate()
+    assert value.get() == ["a", "b"]
+
+
+def test_build_overtaken_by_invalidate_is_not_served():
+    loading, release = threading.Event(), threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(len(loads))
+        if len(loads) == 2:  # the background refresh, still reading the old data
+            loading.set()
+            release.wait(5)
+        return len(loads)
+
+    value = RefreshingValue(loader, ttl=0)
+    assert value.get() == 1
+    time.sleep(0.01)
+    value.get()  # expired: starts the background refresh
+    loading.wait(5)
+    value.invalidate()
+    release.set()
+    assert value.get() == 3
+
+
+def test_expired_build_is_served_while_refreshing():
+    release = threading.Event()
+    builds = iter(["first", "second"])
+
+    def loader():
+        build = next(builds)
+        if build == "second":
+            release.wait(5)
+        return build
+
+    value = RefreshingValue(loader, ttl=0)
+    assert value.get() == "first"
+    time.sleep(0.01)
+    assert value.get() == "first"
+    release.set()
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from conftest import StandInBackend
+from db import ConnectionPool, PoolTimeout, SingleFlight, TransientWriteError, insert_rows, is_transient, iter_batches
+
+
+def test_iter_batches_closed_before_exhaustion_returns_session():
+    pool = ConnectionPool(StandInBackend(), max_size=2, acquire_timeout=0.1)
+    for _ in range(3):
+        batches = iter_batches(pool, "SELECT n FROM t", batch_size=10)
+        assert next(batches) == ["n"]
+        assert len(next(batches)) == 10
+        batches.close()
+        assert pool.stats()["in_use"] == 0
+
+
+def test_iter_batches_closed_after_statement_only_returns_session():
+    pool = ConnectionPool(StandInBackend(), max_size=1, acquire_timeout=0.1)
+    batches = iter_batches(pool, "SELECT n FROM t")
+    next(batches)  # statement ran, no rows fetched yet
+    batches.close()
+    assert pool.stats()["in_use"] == 0
+    assert pool.stats()["idle"] == 1
+
+
+def test_pool_times_out_while_session_is_held():
+    pool = ConnectionPool(StandInBackend(), max_size=1, acquire_timeout=0.05)
+    batches = iter_batches(pool, "SELECT n FROM t")
+    next(batches)
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    batches.close()
+    pool.release(pool.acquire())
+
+
+class OutageAfterFirstBatch(StandInBackend):
+    # The warehouse goes away once the first multi-row batch has landed
+    def execute(self, cursor, query, params):
+        super().execute(cursor, query, params)
+        if len(params) >= 3:
+            self.outage = "TEMPORARILY_UNAVAILABLE: warehouse is starting"
+
+
+def test_insert_rows_reports_data_errors_per_row():
+    pool = ConnectionPool(StandInBackend(), max_size=1)
+    errors = insert_rows(pool, "t", ["n"], [(1, (1,)), (2, (-2,))], batch_size=2)
+    assert list(errors) == [2]
+
+
+def test_insert_rows_raises_transient_failures_with_progress():
+    pool = ConnectionPool(OutageAfterFirstBatch(), max_size=1)
+    rows = [(n, (n,)) for n in range(1, 7)]
+    with pytest.raises(TransientWriteError) as failure:
+        insert_rows(pool, "t", ["n"], rows, batch_size=3)
+    assert failure.value.written == [1, 2, 3]
+    assert failure.value.errors == {}
+    assert is_transient(failure.value.__cause__)
+    assert pool.stats()["in_use"] == 0
+
+
+def test_single_flight_forget_starts_a_fresh_execution():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "before"
+
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    flights.forget()
+    assert flights.do("k", lambda: "after") == "after"  # doesn't join the older query
+    release.set()
+    leader.join()
+    assert results == ["before"]
+    assert flights.stats()["in_flight"] == 0
@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import StandInBackend
+from db import ConnectionPool
+from keepwarm import KeepWarm
+
+
+def test_busy_pool_counts_as_warm():
+    pool = ConnectionPool(StandInBackend(), max_size=1)
+    keep_warm = KeepWarm(pool, acquire_timeout=0.01)
+    held = pool.acquire()
+    assert keep_warm.ping() is None
+    assert keep_warm.status()["state"] == "busy"
+    assert keep_warm.status()["consecutive_failures"] == 0
+    pool.release(held)
+    assert keep_warm.ping() is not None
+    assert keep_warm.status()["state"] == "warm"
+
+
+def test_unreachable_only_after_consecutive_failures():
+    backend = StandInBackend()
+    keep_warm = KeepWarm(ConnectionPool(backend, max_size=2), min_sessions=2, failure_threshold=3)
+    keep_warm.ping(2)
+    backend.outage = "TEMPORARILY_UNAVAILABLE"
+    for expected in ("degraded", "degraded", "unreachable"):
+        with pytest.raises(RuntimeError):
+            keep_warm.ping(2)
+        assert keep_warm.status()["state"] == expected
+    backend.outage = None
+    keep_warm.ping(2)
+    assert keep_warm.status()["state"] == "warm"
+
+
+def test_window_requires_a_timezone():
+    pool = ConnectionPool(StandInBackend(), max_size=1)
+    with pytest.raises(ValueError, match="timezone"):
+        KeepWarm(pool, window="mon-fri 06:00-19:00").start()
+    keep_warm = KeepWarm(pool, window="mon-fri 06:00-19:00", timezone="America/Chicago")
+    keep_warm.start()
+    keep_warm.stop(timeout=5)
+    always = KeepWarm(pool, window="always")  # no window, no timezone needed
+    always.start()
+    always.stop(timeout=5)
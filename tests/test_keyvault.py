@@ -0,0 +1,33 @@
+import threading
+import time
+
+from keyvault import SecretProvider
+
+
+class SlowVault(SecretProvider):
+    def __init__(self, names, **kwargs):
+        super().__init__(names, **kwargs)
+        self.lookups = []
+        self._lookups_lock = threading.Lock()
+
+    def _fetch_one(self, name):
+        with self._lookups_lock:
+            self.lookups.append(name)
+        time.sleep(0.05)
+        return f"{name}-value"
+
+
+def test_get_during_prefetch_waits_for_it():
+    secrets = SlowVault(["HOST", "TOKEN"])
+    secrets.prefetch()
+    assert secrets.get("TOKEN") == "TOKEN-value"
+    assert sorted(secrets.lookups) == ["HOST", "TOKEN"]
+
+
+def test_expired_secret_is_served_while_refreshing():
+    secrets = SlowVault(["HOST"], ttl=0)
+    secrets.refresh()
+    time.sleep(0.01)
+    started = time.monotonic()
+    assert secrets.get("HOST") == "HOST-value"
+    assert time.monotonic() - started < 0.05
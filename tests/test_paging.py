@@ -0,0 +1,69 @@
+import decimal
+import sqlite3
+
+import pytest
+
+import paging
+
+KEYS = ["COALESCE(type, '')", "COALESCE(bushels, 0)", "COALESCE(name, '')"]
+
+
+@pytest.fixture
+def sources():
+    # Few distinct types and bushel values, so most pages end in the middle of a tie
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE sources (name TEXT, type TEXT, bushels REAL)")
+    db.executemany("INSERT INTO sources VALUES (?, ?, ?)", [
+        (f"Producer {n:03d}", "CG"[n % 2] if n % 7 else None, float(n % 3 * 100) if n % 5 else None)
+        for n in range(60)
+    ])
+    return db
+
+
+def read_pages(db, limit, descending=False):
+    # Pages through the table the way the routes do: limit + 1 rows, cursor from the last key values
+    key_columns = ", ".join(f"{k} AS _k{i}" for i, k in enumerate(KEYS))
+    pages, cursor = [], None
+    while True:
+        where, params = "", []
+        if cursor:
+            predicate, params = paging.keyset_predicate(KEYS, paging.decode_cursor(cursor, len(KEYS)), descending)
+            where = f"WHERE {predicate}"
+        rows = db.execute(
+            f"SELECT name, {key_columns} FROM sources {where} ORDER BY {paging.order_by(KEYS, descending)} LIMIT {limit + 1}",
+            params,
+        ).fetchall()
+        page = rows[:limit]
+        pages.append([row[0] for row in page])
+        if len(rows) <= limit:
+            return pages
+        assert len(pages) <= 60, "the cursor stopped advancing"
+        cursor = paging.encode_cursor(page[-1][1:])
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 7, 60])
+def test_pages_cover_every_row_once_in_order(sources, limit, descending):
+    everything = [row[0] for row in sources.execute(f"SELECT name FROM sources ORDER BY {paging.order_by(KEYS, descending)}")]
+    pages = read_pages(sources, limit, descending)
+    assert [name for page in pages for name in page] == everything
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_cursor_round_trip():
+    values = ["G", decimal.Decimal("12.5"), "Producer 001"]
+    token = paging.encode_cursor(values)
+    assert "=" not in token
+    assert paging.decode_cursor(token, 3) == ["G", 12.5, "Producer 001"]
+
+
+@pytest.mark.parametrize("token", ["not a cursor", paging.encode_cursor([1, 2]), paging.encode_cursor({"a": 1})])
+def test_bad_cursor_is_rejected(token):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        paging.decode_cursor(token, 3)
+
+
+def test_keyset_predicate_spells_out_the_comparison():
+    predicate, params = paging.keyset_predicate(["a", "b"], [1, 2], descending=True)
+    assert predicate == "((a < ?) OR (a = ? AND b < ?))"
+    assert params == [1, 1, 2]
@@ -0,0 +1,53 @@
+import datetime
+import io
+
+from openpyxl import Workbook
+
+from spreadsheets import read_sheet, validate
+
+FIELDS = ["plantid", "bushels", "fromdate", "todate"]
+
+
+def check(frame):
+    return validate(frame, FIELDS, numeric=["bushels"], dates=["fromdate", "todate"],
+                    date_ranges=[("fromdate", "todate")])
+
+
+def test_csv_rows_keep_their_sheet_row_numbers_across_blank_lines():
+    sheet = (
+        "Plant ID,Bushels,From Date,To Date\n"
+        "1,100,2025-01-01,2025-01-31\n"
+        "2,200,2025-02-01,2025-02-28\n"
+        ",,,\n"
+        "3,300,not a date,2025-03-31\n"
+    )
+    rows, errors = check(read_sheet(io.BytesIO(sheet.encode()), "inputs.csv"))
+    assert [n for n, _ in rows] == [2, 3]
+    assert errors == [{"row": 5, "column": "fromdate", "error": "not a valid date", "value": "not a date"}]
+
+
+def test_xlsx_rows_keep_their_sheet_row_numbers_across_blank_rows():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["plantid", "bushels", "fromdate", "todate"])
+    sheet.append([1, 100, datetime.datetime(2025, 1, 1), datetime.datetime(2025, 1, 31)])
+    sheet.append([None, None, None, None])
+    sheet.append([2, "lots", datetime.datetime(2025, 2, 1), datetime.datetime(2025, 2, 28)])
+    upload = io.BytesIO()
+    workbook.save(upload)
+    upload.seek(0)
+
+    rows, errors = check(read_sheet(upload, "inputs.xlsx"))
+    assert [n for n, _ in rows] == [2]
+    assert errors == [{"row": 4, "column": "bushels", "error": "not a number", "value": "lots"}]
+
+
+def test_dates_in_different_formats_are_each_parsed():
+    sheet = (
+        "plantid,bushels,fromdate,todate\n"
+        "1,100,2025-01-01,01/31/2025\n"
+        "2,200,02/01/2025,2025-01-31\n"
+    )
+    rows, errors = check(read_sheet(io.BytesIO(sheet.encode()), "inputs.csv"))
+    assert rows == [(2, ("1", 100, datetime.date(2025, 1, 1), datetime.date(2025, 1, 31)))]
+    assert errors == [{"row": 3, "column": "todate", "error": "must not be before fromdate", "value": "2025-01-31"}]
@@ -0,0 +1,45 @@
+import threading
+
+from versions import DataVersions
+
+
+def test_bump_is_seen_by_another_process_on_the_same_file(tmp_path):
+    path = str(tmp_path / "versions.db")
+    worker_a, worker_b = DataVersions(path), DataVersions(path)
+    before = worker_b.current(("dashboard",))
+    worker_a.bump("dashboard")
+    assert worker_b.current(("dashboard",)) != before
+    assert worker_b.current(("sourcing",)) == worker_a.current(("sourcing",))
+
+
+def test_invalidate_everything_moves_every_tag(tmp_path):
+    versions = DataVersions(str(tmp_path / "versions.db"))
+    before = versions.current(("dashboard",))
+    versions.bump("*")
+    assert versions.current(("dashboard",)) != before
+
+
+def test_sequence_grows_with_every_bump(tmp_path):
+    versions = DataVersions(str(tmp_path / "versions.db"))
+    sequences = [versions.sequence()]
+    for tags in (("customer",), ("customer", "dashboard"), ("*",)):
+        versions.bump(*tags)
+        sequences.append(versions.sequence())
+    assert sequences == sorted(set(sequences))
+
+
+def test_new_file_starts_a_new_epoch(tmp_path):
+    first = DataVersions(str(tmp_path / "a.db")).current(("customer",))
+    second = DataVersions(str(tmp_path / "b.db")).current(("customer",))
+    assert first[1:] == second[1:] and first != second
+
+
+def test_concurrent_bumps_are_all_counted(tmp_path):
+    path = str(tmp_path / "versions.db")
+    workers = [DataVersions(path) for _ in range(4)]
+    threads = [threading.Thread(target=lambda v=v: [v.bump("customer") for _ in range(25)]) for v in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert workers[0].current(("customer",))[2] == 100
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from write_queue import WriteQueue
+
+
+class TransientError(Exception):
+    def __init__(self, written=(), errors=None):
+        super().__init__("TEMPORARILY_UNAVAILABLE")
+        self.written = list(written)
+        self.errors = errors or {}
+
+
+def make_queue(tmp_path, writer, **kwargs):
+    # Started for the journal schema, then the worker is stopped so tests drain by hand
+    queue = WriteQueue(str(tmp_path / "queue.db"), writer, backoff_seconds=0, linger_seconds=0, **kwargs)
+    queue.start()
+    queue.stop(timeout=5)
+    return queue
+
+
+def test_transient_failure_is_retried(tmp_path):
+    calls = []
+
+    def writer(kind, rows):
+        calls.append([seq for seq, _ in rows])
+        if len(calls) == 1:
+            raise TransientError()
+        return {}
+
+    queue = make_queue(tmp_path, writer)
+    job_id = queue.enqueue("customer", [(1,), (2,)])
+    assert queue.drain_once()
+    assert queue.status(job_id)["status"] == "queued"
+    assert queue.drain_once()
+    job = queue.status(job_id)
+    assert (job["status"], job["inserted"], job["attempts"]) == ("done", 2, 2)
+    assert calls == [[0, 1], [0, 1]]
+
+
+def test_rows_settled_before_a_transient_failure_are_not_rewritten(tmp_path):
+    written = []
+
+    def writer(kind, rows):
+        values = [values[0] for _, values in rows]
+        if not written:
+            written.append(values[:1])
+            raise TransientError(written=[rows[0][0]], errors={rows[1][0]: "bad row"})
+        written.append(values)
+        return {}
+
+    queue = make_queue(tmp_path, writer)
+    job_id = queue.enqueue("customer", [(1,), (2,), (3,)])
+    queue.drain_once()
+    queue.drain_once()
+    job = queue.status(job_id)
+    assert written == [[1], [3]]
+    assert (job["status"], job["inserted"], job["errors"]) == ("partial", 2, [{"row": 2, "error": "bad row"}])
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    def writer(kind, rows):
+        raise TransientError()
+
+    queue = make_queue(tmp_path, writer, max_attempts=2)
+    job_id = queue.enqueue("customer", [(1,)])
+    queue.drain_once()
+    queue.drain_once()
+    job = queue.status(job_id)
+    assert (job["status"], job["attempts"], job["last_error"]) == ("failed", 2, "TEMPORARILY_UNAVAILABLE")
+    assert not queue.drain_once()
+
+
+def test_concurrent_drains_claim_each_job_once(tmp_path):
+    written = []
+    lock = threading.Lock()
+
+    def writer(kind, rows):
+        time.sleep(0.01)
+        with lock:
+            written.extend(values[0] for _, values in rows)
+        return {}
+
+    queues = [make_queue(tmp_path, writer, max_rows=1) for _ in range(4)]
+    for n in range(40):
+        queues[0].enqueue("customer", [(n,)])
+
+    def drain(queue):
+        while queue.drain_once():
+            pass
+
+    threads = [threading.Thread(target=drain, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(written) == list(range(40))
+
+
+def test_abandoned_claims_are_requeued(tmp_path):
+    queue = make_queue(tmp_path, lambda kind, rows: {}, claim_timeout=0)
+    job_id = queue.enqueue("customer", [(1,)])
+    with queue._connect() as connection:
+        connection.execute("UPDATE jobs SET status = 'writing', updated_at = 0")
+    assert queue.drain_once()
+    assert queue.status(job_id)["status"] == "done"
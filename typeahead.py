@@ -0,0 +1,70 @@
+from bisect import bisect_left, bisect_right
+
+
+# In-memory name index for typeahead lookups. Distinct names are kept sorted by
+# their case-folded form, so a prefix query is a bisect plus a short scan. For
+# substring queries, the folded names are also joined into one newline-separated
+# string, so the search runs as str.find over a single buffer instead of a
+# Python loop over every name.
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+
+
+class NameIndex:
+    def __init__(self, names):
+        self.names = list(names)  # as loaded (order and duplicates kept) for the full listing
+        distinct = sorted({name for name in self.names if name}, key=lambda name: (name.casefold(), name))
+        self._sorted = distinct
+        self._folded = [name.casefold() for name in distinct]
+        self._blob = "\n".join(self._folded)
+        self._offsets = []  # start of each folded name within _blob
+        position = 0
+        for folded in self._folded:
+            self._offsets.append(position)
+            position += len(folded) + 1
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def prefix(self, query, limit=DEFAULT_LIMIT):
+        query = query.casefold()
+        start = bisect_left(self._folded, query)
+        matches = []
+        for i in range(start, len(self._folded)):
+            if len(matches) >= limit or not self._folded[i].startswith(query):
+                break
+            matches.append(self._sorted[i])
+        return matches
+
+    def contains(self, query, limit=DEFAULT_LIMIT, skip_prefix=False):
+        # Names containing `query` anywhere, in sorted order; with skip_prefix,
+        # only those where it isn't at the start (prefix() already has those)
+        query = query.casefold()
+        if "\n" in query:
+            return []
+        matches, position = [], 0
+        while len(matches) < limit:
+            position = self._blob.find(query, position)
+            if position < 0:
+                break
+            i = bisect_right(self._offsets, position) - 1
+            if not (skip_prefix and position == self._offsets[i]):
+                matches.append(self._sorted[i])
+            # Continue after this name so a name matching twice is listed once
+            position = self._offsets[i + 1] if i + 1 < len(self._offsets) else len(self._blob)
+        return matches
+
+    def search(self, query, limit=DEFAULT_LIMIT, match="auto"):
+        # match: "prefix", "contains", or "auto" (prefix hits first, then other substring hits)
+        query = query.strip()
+        if not query:
+            return []
+        if match == "prefix":
+            return self.prefix(query, limit)
+        if match == "contains":
+            return self.contains(query, limit)
+        matches = self.prefix(query, limit)
+        if len(matches) < limit:
+            matches += self.contains(query, limit - len(matches), skip_prefix=True)
+        return matches
@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+import uuid
+
+
+# Data version counters: one per cache tag, bumped whenever that tag is
+# invalidated ("*" for invalidate-everything). They live in a small local SQLite
+# file instead of process memory, so every worker process on the host reads the
+# same values and a write handled by one worker moves the version that the others
+# check their cached results and ETags against. The file records an epoch when it
+# is created, so counters starting over in a new file never repeat a version.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS epoch (id INTEGER PRIMARY KEY CHECK (id = 1), value TEXT NOT NULL);
+"""
+
+
+class DataVersions:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # one connection per thread
+        self._lock = threading.Lock()
+        self._epoch = None
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            with self._lock:
+                if self._epoch is None:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(SCHEMA)
+                    connection.execute("INSERT OR IGNORE INTO epoch VALUES (1, ?)", (uuid.uuid4().hex[:8],))
+                    self._epoch = connection.execute("SELECT value FROM epoch").fetchone()[0]
+            self._local.connection = connection
+        return connection
+
+    def current(self, tags=()):
+        # (epoch, version of "*", version of each tag): changes whenever any of `tags` is invalidated
+        wanted = ("*",) + tuple(tags)
+        rows = dict(self._connect().execute(
+            f"SELECT tag, version FROM versions WHERE tag IN ({', '.join('?' * len(wanted))})", wanted
+        ).fetchall())
+        return (self._epoch,) + tuple(rows.get(tag, 0) for tag in wanted)
+
+    def sequence(self):
+        # Grows with every bump of any tag
+        return self._connect().execute("SELECT COALESCE(SUM(version), 0) FROM versions").fetchone()[0]
+
+    def bump(self, *tags):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO versions VALUES (?, 1) ON CONFLICT (tag) DO UPDATE SET version = version + 1",
+                [(tag,) for tag in tags]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
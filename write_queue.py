@@ -0,0 +1,228 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Write-behind queue. Accepted writes are journaled to a local SQLite file and
+# acknowledged with a job id straight away; a background worker drains the
+# journal to the warehouse, coalescing queued jobs of the same kind into one
+# batched write and retrying with backoff when the warehouse is unavailable.
+#
+# `writer(kind, rows)` does the actual write: rows are (seq, values) pairs and it
+# returns {seq: error} for rows that were rejected (see db.insert_rows). When it
+# raises, the job is retried with backoff; an exception carrying `written` (seqs
+# that landed) and `errors` ({seq: error}) settles those rows first, so only the
+# rest of the job goes around again.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    errors TEXT,
+    settled TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, kind, next_attempt_at);
+"""
+
+
+class WriteQueue:
+    def __init__(self, path, writer, max_rows=500, max_attempts=5, backoff_seconds=2.0,
+                 poll_interval=5.0, linger_seconds=0.2, claim_timeout=900.0):
+        self.path = path
+        self.writer = writer
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        self.linger_seconds = linger_seconds
+        self.claim_timeout = claim_timeout
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+                if "settled" not in columns:  # journals created before rows could settle across attempts
+                    connection.execute("ALTER TABLE jobs ADD COLUMN settled TEXT")
+            self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def enqueue(self, kind, rows):
+        # rows: list of value tuples; returns the job id
+        self.start()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, payload, status, rows, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps([list(r) for r in rows], default=str), len(rows), now, now)
+            )
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id, kind, status, rows, inserted, errors, attempts, last_error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["errors"] = json.loads(job["errors"]) if job["errors"] else []
+        return job
+
+    def stats(self):
+        if self._thread is None:
+            return {"running": False}
+        with self._connect() as connection:
+            counts = dict(connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"running": self._thread.is_alive(), "jobs": counts}
+
+    # -------------------- worker --------------------
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                print(f"Write queue drain failed: {e}")
+                drained = False
+            if not drained:
+                self._wake.wait(self._idle_seconds())
+                self._wake.clear()
+                if self.linger_seconds:
+                    # Give writes arriving together a moment to land in the same batch
+                    time.sleep(self.linger_seconds)
+
+    def _idle_seconds(self):
+        # Sleep until the next retry is due, or the poll interval, whichever is sooner
+        with self._connect() as connection:
+            due = connection.execute("SELECT MIN(next_attempt_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if due is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(due - time.time(), 0.05))
+
+    def _claim(self):
+        # Oldest due kind, then as many of its queued jobs as fit in max_rows. Several
+        # worker processes may drain one journal, so the claim is a single write
+        # transaction and a job only counts as claimed if it was still queued.
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # Jobs left mid-write by a worker that died go around again; a live
+            # worker's claim is younger than claim_timeout and stays put
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'writing' AND updated_at < ?",
+                (now, now - self.claim_timeout)
+            )
+            first = connection.execute(
+                "SELECT kind FROM jobs WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if first is None:
+                return None, []
+            jobs, total = [], 0
+            for job in connection.execute(
+                "SELECT id, payload, rows, attempts, errors, settled, last_error FROM jobs WHERE status = 'queued' AND kind = ? AND next_attempt_at <= ? ORDER BY created_at",
+                (first["kind"], now)
+            ):
+                if jobs and total + job["rows"] > self.max_rows:
+                    break
+                jobs.append(job)
+                total += job["rows"]
+            jobs = [
+                job for job in jobs
+                if connection.execute(
+                    "UPDATE jobs SET status = 'writing', updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (now, job["id"])
+                ).rowcount == 1
+            ]
+        return first["kind"], jobs
+
+    def drain_once(self):
+        kind, jobs = self._claim()
+        if not jobs:
+            return False
+
+        rows, owners = [], {}
+        for job in jobs:
+            settled = set(json.loads(job["settled"])) if job["settled"] else set()
+            for row_number, values in enumerate(json.loads(job["payload"]), start=1):
+                if row_number in settled:
+                    continue
+                seq = len(rows)
+                owners[seq] = (job["id"], row_number)
+                rows.append((seq, tuple(values)))
+
+        try:
+            failed = self.writer(kind, rows)
+            written, error = [seq for seq, _ in rows if seq not in failed], None
+        except Exception as e:
+            failed, written, error = getattr(e, "errors", {}), getattr(e, "written", []), str(e)
+        self._settle(jobs, owners, written, failed, error)
+        return True
+
+    def _settle(self, jobs, owners, written, failed, error):
+        # Records which rows landed or were rejected; jobs with rows still
+        # outstanding after a failed write are requeued with exponential backoff
+        outcome = {job["id"]: ([], []) for job in jobs}  # job id -> (settled rows, row errors)
+        for seq in written:
+            job_id, row_number = owners[seq]
+            outcome[job_id][0].append(row_number)
+        for seq, message in failed.items():
+            job_id, row_number = owners[seq]
+            outcome[job_id][0].append(row_number)
+            outcome[job_id][1].append({"row": row_number, "error": message})
+
+        now = time.time()
+        with self._connect() as connection:
+            for job in jobs:
+                settled = (json.loads(job["settled"]) if job["settled"] else []) + outcome[job["id"]][0]
+                errors = (json.loads(job["errors"]) if job["errors"] else []) + outcome[job["id"]][1]
+                attempts = job["attempts"] + 1
+                inserted = len(settled) - len(errors)
+                next_attempt_at = now
+                if len(settled) == job["rows"]:
+                    status = "done" if not errors else ("partial" if inserted else "failed")
+                elif attempts >= self.max_attempts:
+                    status = "partial" if inserted else "failed"
+                else:
+                    status = "queued"
+                    next_attempt_at = now + self.backoff_seconds * 2 ** (attempts - 1)
+                connection.execute(
+                    "UPDATE jobs SET status = ?, inserted = ?, errors = ?, settled = ?, attempts = ?, last_error = ?, "
+                    "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                    (status, inserted, json.dumps(errors) if errors else None, json.dumps(settled), attempts,
+                     error or job["last_error"], next_attempt_at, now, job["id"])
+                )